@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from callback_metrics import phase
+from singleflight import SingleFlight
+
+#----------------------------------------------------------------------------------------------------------------------
+#fused aggregation for charts that share a date picker
+#every chart registers the keys it groups by. the first chart asking for a date range groups the slice once by the
+#union of all registered keys, the result is kept per date range and every chart rolls it up to its own keys
+
+FINE_COUNT = 'fine_count'
+
+
+#categorical columns are grouped on their integer codes, missing values are code -1 so they are kept as a group
+#(grouping the categoricals themselves with dropna=False loses them). decode_codes turns the codes back afterwards
+def grouping_keys(frame, columns):
+    return [frame[column].cat.codes.rename(column) if frame[column].dtype == 'category' else column
+            for column in columns]
+
+
+def decode_codes(table, frame, columns):
+    for column in columns:
+        if frame[column].dtype == 'category':
+            table[column] = pd.Categorical.from_codes(table[column], dtype=frame[column].dtype)
+    return table
+
+
+def _drop_missing_keys(table, keys):
+    present = table[keys].notna().all(axis=1)
+    return table if present.all() else table[present]
+
+
+#sum of the count column per keys, same rows and order as
+#rows.groupby(keys).size().sort_values(ascending=False).reset_index(name=name) on the rows the table aggregates
+def counts_by(table, keys, column, name='shipment_sum'):
+    with phase('groupby') as timed:
+        timed.rows = len(table)
+        table = _drop_missing_keys(table, keys)
+        summed = table.groupby(grouping_keys(table, keys))[column].sum()
+        return decode_codes(summed.sort_values(ascending=False).reset_index(name=name), table, keys)
+
+
+def sums_by(table, keys, columns):
+    with phase('groupby') as timed:
+        timed.rows = len(table)
+        table = _drop_missing_keys(table, keys)
+        summed = table.groupby(grouping_keys(table, keys))[list(columns)].sum()
+        return decode_codes(summed.reset_index(), table, keys)
+
+
+#keys, the summed measures and the number of rows (as column rows, when given) per group, in key order. dropna=False
+#keeps the groups with missing keys. aggregator (a ShardedAggregator) groups large tables in date shards
+def group_rows(table, keys, measures=(), rows=None, dropna=True, aggregator=None):
+    def partial(shard):
+        grouped = shard.groupby(grouping_keys(shard, keys), dropna=dropna)
+        counts = grouped.size()
+        summed = grouped[list(measures)].sum() if measures else pd.DataFrame(index=counts.index)
+        if rows is not None:
+            summed[rows] = counts
+        return summed
+
+    with phase('groupby') as timed:
+        timed.rows = len(table)
+        if dropna:
+            table = _drop_missing_keys(table, keys)
+        summed = partial(table) if aggregator is None else aggregator.aggregate(table, partial)
+        return decode_codes(summed.reset_index(), table, keys)
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#density binning for scatter charts
+#a scatter of aggregated points (one row per exact x, y and series value with a weight) is sent as is while it fits
+#the point budget. above it x is cut into log spaced bins and y into linear bins so that series x bins x y bins stays
+#within the budget (0 always sends the exact points), y keeps its exact values when there are few of them. every bin
+#is drawn at the weighted mean x and y of its points with the summed weight, so sizing markers by the weight still
+#shows where the shipments are
+
+
+def _bin_codes(values, edges):
+    #one binary search over the inner edges, bin i is (edges[i], edges[i + 1]], the first one also holds edges[0]
+    return np.searchsorted(edges[1:-1], values, side='left')
+
+
+def density_bins(points, x, y, weight, by, budget):
+    if not budget or len(points) <= budget:
+        return points
+    series = max(points[by].nunique(), 1)
+    cells = max(budget // series, 1)
+    y_values = points[y].to_numpy(dtype=float)
+    x_values = points[x].to_numpy(dtype=float)
+    #at least 16 distance bins (when the budget allows), the rest of the budget goes to y
+    y_bins = min(points[y].nunique(), max(cells // 16, 1))
+    x_bins = max(cells // y_bins, 1)
+
+    if y_bins < points[y].nunique():
+        y_code = _bin_codes(y_values, np.linspace(y_values.min(), y_values.max(), y_bins + 1))
+    else:
+        y_code = y_values
+    #log spaced, distances below 1 share the first bin
+    x_log = np.log10(np.clip(x_values, 1, None))
+    x_code = _bin_codes(x_log, np.linspace(x_log.min(), x_log.max(), x_bins + 1))
+
+    w = points[weight].to_numpy(dtype=float)
+    binned = pd.DataFrame({by: points[by].to_numpy(), 'x_code': x_code, 'y_code': y_code,
+                           x: x_values * w, y: y_values * w, weight: w})
+    binned = binned.groupby([by, 'x_code', 'y_code'], observed=True, sort=True)[[x, y, weight]].sum()
+    binned = binned[binned[weight] > 0].reset_index(drop=False)
+    binned[x] = binned[x] / binned[weight]
+    binned[y] = binned[y] / binned[weight]
+    binned[weight] = binned[weight].astype(points[weight].dtype)
+    return binned[[by, x, y, weight]]
+
+
+class AggregationPlanner:
+
+    #backend (query_backend) runs the grouping of its table, weight is the count column when the table is already
+    #aggregated (a DailyCube), None to count rows
+    def __init__(self, backend, table, weight=None, max_ranges=8):
+        self.backend = backend
+        self.table = table
+        self.weight = weight
+        self.max_ranges = max_ranges
+        self.charts = {}
+        self._fine = OrderedDict()
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def register(self, chart, keys):
+        self.charts[chart] = list(keys)
+        with self._lock:
+            self._fine.clear()
+
+    def fine_keys(self):
+        keys = []
+        for chart_keys in self.charts.values():
+            keys += [key for key in chart_keys if key not in keys]
+        return keys
+
+    #the lock only guards the dict, ranges are grouped concurrently and a range already being grouped is waited for
+    #instead of grouped again
+    def fine(self, start_date, end_date):
+        key = (self.backend.version(self.table), start_date, end_date)
+        with self._lock:
+            if key in self._fine:
+                self._fine.move_to_end(key)
+                return self._fine[key]
+        return self._flights.do(key, lambda: self._group(key, start_date, end_date))
+
+    def _group(self, key, start_date, end_date):
+        #a range grouped just before this call became the leader
+        with self._lock:
+            if key in self._fine:
+                return self._fine[key]
+        if self.weight is None:
+            fine = self.backend.group(self.table, start_date, end_date, self.fine_keys(), rows=FINE_COUNT, dropna=False)
+        else:
+            fine = self.backend.group(self.table, start_date, end_date, self.fine_keys(), [self.weight],
+                                      dropna=False).rename(columns={self.weight: FINE_COUNT})
+        with self._lock:
+            self._fine[key] = fine
+            while len(self._fine) > self.max_ranges:
+                self._fine.popitem(last=False)
+        return fine
+
+    #same result as slice.groupby(keys).size().sort_values(ascending=False).reset_index(name=name)
+    def counts(self, chart, start_date, end_date, name='shipment_sum'):
+        return counts_by(self.fine(start_date, end_date), self.charts[chart], FINE_COUNT, name)
@@ -0,0 +1,223 @@
+// ---------------------------------------------------------------------------------------------------------------------
+// client side filtering for the outbound shipping dashboard
+// the store holds one pre-aggregated table per chart (see clientside.py), every function below keeps the rows
+// matching the dropdown values and builds the same figure plotly express builds on the server
+
+(function () {
+    var COLORS = ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3', '#FF6692', '#B6E880', '#FF97FF',
+                  '#FECB52'];
+
+    function colorway(template) {
+        return (template && template.layout && template.layout.colorway) || COLORS;
+    }
+
+    // a plain list, or {values, codes} for a dictionary encoded column (code -1 is missing)
+    function column(table, name) {
+        var encoded = table.columns[name];
+        if (Array.isArray(encoded)) {
+            return encoded;
+        }
+        return encoded.codes.map(function (code) {
+            return code < 0 ? null : encoded.values[code];
+        });
+    }
+
+    function selectedRows(table, filters, values) {
+        var columns = filters.map(function (name) {
+            return column(table, name);
+        });
+        var rows = [];
+        for (var row = 0; row < table.length; row++) {
+            var keep = true;
+            for (var position = 0; position < columns.length; position++) {
+                if (columns[position][row] !== values[position]) {
+                    keep = false;
+                    break;
+                }
+            }
+            if (keep) {
+                rows.push(row);
+            }
+        }
+        return rows;
+    }
+
+    function pick(values, rows) {
+        return rows.map(function (row) {
+            return values[row];
+        });
+    }
+
+    // rows per value of the color column, in order of first appearance like plotly express
+    function splitBy(rows, values) {
+        var order = [];
+        var parts = {};
+        rows.forEach(function (row) {
+            var key = String(values[row]);
+            if (!(key in parts)) {
+                parts[key] = [];
+                order.push(key);
+            }
+            parts[key].push(row);
+        });
+        return order.map(function (key) {
+            return [key, parts[key]];
+        });
+    }
+
+    function graph(id, figure) {
+        return [{type: 'Graph', namespace: 'dash_core_components', props: {id: id, figure: figure}}];
+    }
+
+    function axes(spec, template, y) {
+        return {
+            template: template,
+            xaxis: {anchor: 'y', domain: [0, 1], title: {text: spec.x}},
+            yaxis: {anchor: 'x', domain: [0, 1], title: {text: y}},
+            legend: {title: {text: spec.color}, tracegroupgap: 0},
+            margin: {t: 60}
+        };
+    }
+
+    function ready(spec, data) {
+        return data && data[spec.table];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dashboard: {
+            bar: function (spec, data, values, template) {
+                if (!ready(spec, data)) {
+                    return window.dash_clientside.no_update;
+                }
+                var table = data[spec.table];
+                var rows = selectedRows(table, spec.filters, values);
+                var x = column(table, spec.x);
+                var y = column(table, spec.y);
+                var colors = colorway(template);
+                var traces = splitBy(rows, column(table, spec.color)).map(function (part, n) {
+                    var name = part[0];
+                    return {
+                        type: 'bar', name: name, legendgroup: name, offsetgroup: name, alignmentgroup: 'True',
+                        showlegend: true, orientation: 'v', textposition: 'auto',
+                        marker: {color: colors[n % colors.length], pattern: {shape: ''}},
+                        x: pick(x, part[1]), y: pick(y, part[1]), xaxis: 'x', yaxis: 'y',
+                        hovertemplate: spec.color + '=' + name + '<br>' + spec.x + '=%{x}<br>' + spec.y +
+                            '=%{y}<extra></extra>'
+                    };
+                });
+                var layout = axes(spec, template, spec.y);
+                layout.barmode = 'relative';
+                return graph(spec.graph, {data: traces, layout: layout});
+            },
+
+            scatter: function (spec, data, values, template) {
+                if (!ready(spec, data)) {
+                    return window.dash_clientside.no_update;
+                }
+                var table = data[spec.table];
+                var rows = selectedRows(table, spec.filters, values);
+                var x = column(table, spec.x);
+                var y = column(table, spec.y);
+                var size = column(table, spec.size);
+                var color = column(table, spec.color);
+                var colors = colorway(template);
+                var largest = 0;
+                rows.forEach(function (row) {
+                    largest = Math.max(largest, size[row]);
+                });
+                // marker area proportional to size, the largest marker is size_max pixels across
+                var sizeref = largest / (spec.size_max * spec.size_max);
+                var type = rows.length >= 1000 ? 'scattergl' : 'scatter';
+                var traces = splitBy(rows, color).map(function (part, n) {
+                    var name = part[0];
+                    return {
+                        type: type, mode: 'markers', name: name, legendgroup: name, showlegend: true,
+                        orientation: 'v', x: pick(x, part[1]), y: pick(y, part[1]), xaxis: 'x', yaxis: 'y',
+                        hovertext: pick(color, part[1]),
+                        marker: {color: colors[n % colors.length], size: pick(size, part[1]), sizemode: 'area',
+                                 sizeref: sizeref, symbol: 'circle'},
+                        hovertemplate: '<b>%{hovertext}</b><br><br>' + spec.color + '=' + name + '<br>' + spec.x +
+                            '=%{x}<br>' + spec.y + '=%{y}<br>' + spec.size + '=%{marker.size}<extra></extra>'
+                    };
+                });
+                var layout = axes(spec, template, spec.y);
+                if (spec.log_x) {
+                    layout.xaxis.type = 'log';
+                }
+                return graph(spec.graph, {data: traces, layout: layout});
+            },
+
+            choropleth: function (spec, data, values, template) {
+                if (!ready(spec, data)) {
+                    return window.dash_clientside.no_update;
+                }
+                var table = data[spec.table];
+                var rows = selectedRows(table, spec.filters, values);
+                var trace = {
+                    type: 'choropleth', locations: pick(column(table, spec.locations), rows),
+                    z: pick(column(table, spec.z), rows), locationmode: 'USA-states', colorscale: 'Reds',
+                    colorbar: {title: {text: spec.z}}
+                };
+                return graph(spec.graph, {data: [trace], layout: {template: template, title: {text: spec.title},
+                                                                  geo: {scope: 'usa'}}});
+            },
+
+            sunburst: function (spec, data, values, template) {
+                if (!ready(spec, data)) {
+                    return window.dash_clientside.no_update;
+                }
+                var table = data[spec.table];
+                var rows = selectedRows(table, spec.filters, values);
+                var path = spec.path.map(function (name) {
+                    return column(table, name);
+                });
+                var weight = column(table, spec.values);
+                var color = column(table, spec.color);
+                var nodes = {};
+                var order = [];
+                // leaves first, then every level up to the root like plotly express. a node whose children do not
+                // share one color value gets '(?)'
+                for (var depth = path.length; depth > 0; depth--) {
+                    rows.forEach(function (row) {
+                        var labels = path.slice(0, depth).map(function (level) {
+                            return String(level[row]);
+                        });
+                        var id = labels.join('/');
+                        if (!(id in nodes)) {
+                            nodes[id] = {label: labels[depth - 1], parent: labels.slice(0, depth - 1).join('/'),
+                                         value: 0, color: color[row]};
+                            order.push(id);
+                        } else if (nodes[id].color !== color[row]) {
+                            nodes[id].color = '(?)';
+                        }
+                        nodes[id].value += weight[row];
+                    });
+                }
+                var colors = colorway(template);
+                var assigned = {};
+                var used = 0;
+                var trace = {
+                    type: 'sunburst', branchvalues: 'total', name: '', domain: {x: [0, 1], y: [0, 1]},
+                    ids: order, labels: [], parents: [], values: [], customdata: [], marker: {colors: []},
+                    hovertemplate: 'labels=%{label}<br>' + spec.values + '=%{value}<br>parent=%{parent}<br>id=%{id}<br>' +
+                        spec.color + '=%{customdata[0]}<extra></extra>'
+                };
+                order.forEach(function (id) {
+                    var node = nodes[id];
+                    var key = String(node.color);
+                    if (!(key in assigned)) {
+                        assigned[key] = colors[used++ % colors.length];
+                    }
+                    trace.labels.push(node.label);
+                    trace.parents.push(node.parent);
+                    trace.values.push(node.value);
+                    trace.customdata.push([node.color]);
+                    trace.marker.colors.push(assigned[key]);
+                });
+                return graph(spec.graph, {data: [trace], layout: {template: template, legend: {tracegroupgap: 0},
+                                                                  margin: {t: 60}, width: spec.width,
+                                                                  height: spec.height}});
+            }
+        }
+    });
+})();
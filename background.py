@@ -0,0 +1,115 @@
+import contextvars
+import functools
+import itertools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+from dash.exceptions import PreventUpdate
+
+from singleflight import Cancelled
+
+#----------------------------------------------------------------------------------------------------------------------
+#background execution of heavy callbacks
+#heavy callbacks run on a bounded worker pool instead of the request thread. every job is tagged with the browser
+#(a client id cookie) and the output it renders, a newer request for the same client and output supersedes it: a job
+#still queued is dropped when its turn comes, a running one stops at its next checkpoint. checkpoint() is called at
+#every data phase (callback_metrics.phase), so a stale sunburst stops after its slice or its groupby instead of
+#building a figure nobody will see. the superseded request answers 'no update', the browser has a newer one pending
+
+COOKIE = 'dash_client_id'
+
+_job = contextvars.ContextVar('background_job', default=None)
+
+
+#a superseded leader's single flight followers compute for their own browsers
+class Superseded(PreventUpdate, Cancelled):
+    pass
+
+
+def checkpoint():
+    job = _job.get()
+    if job is not None and job.superseded():
+        raise Superseded()
+
+
+class _Job:
+
+    def __init__(self, pool, key, generation):
+        self.pool = pool
+        self.key = key
+        self.generation = generation
+
+    def superseded(self):
+        return self.pool.latest.get(self.key) != self.generation
+
+
+class CallbackPool:
+
+    def __init__(self, max_workers=4):
+        #0 workers runs every callback in its request thread as before
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='callback') if max_workers else None
+        self.latest = {}
+        self.completed = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {'completed': self.completed, 'dropped': self.dropped, 'cancelled': self.cancelled,
+                    'pending': len(self.latest)}
+
+    @staticmethod
+    def client_id():
+        return flask.request.cookies.get(COOKIE) or flask.request.remote_addr
+
+    #callback decorator, outside a dash request (e.g. the benchmarks) the callback runs directly
+    def superseding(self, func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if self.executor is None or not flask.has_request_context():
+                return func(*args)
+            body = flask.request.get_json(silent=True) or {}
+            key = (self.client_id(), body.get('output', func.__name__))
+            with self._lock:
+                generation = next(self._generations)
+                self.latest[key] = generation
+            job = _Job(self, key, generation)
+            #the copied context carries the request's metrics trace into the worker
+            context = contextvars.copy_context()
+            return self.executor.submit(context.run, self._run, job, func, args).result()
+        return wrapper
+
+    def _run(self, job, func, args):
+        if job.superseded():
+            self._count('dropped')
+            raise Superseded()
+        token = _job.set(job)
+        try:
+            result = func(*args)
+        except Superseded:
+            self._count('cancelled')
+            raise
+        finally:
+            _job.reset(token)
+            with self._lock:
+                if self.latest.get(job.key) == job.generation:
+                    del self.latest[job.key]
+        self._count('completed')
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _after_request(self, response):
+        if COOKIE not in flask.request.cookies:
+            response.set_cookie(COOKIE, uuid.uuid4().hex, httponly=True, samesite='Lax')
+        return response
+
+    #gives every browser its client id cookie
+    def register(self, app):
+        app.server.after_request(self._after_request)
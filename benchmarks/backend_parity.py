@@ -0,0 +1,133 @@
+import argparse
+import inspect
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks.run_benchmarks import APPS, FILTERS, date_ranges
+
+#----------------------------------------------------------------------------------------------------------------------
+#query backend parity check
+#runs every server callback of both apps over the benchmark date ranges and filter sweeps once with the pandas query
+#backend (the reference) and once with duckdb, each in a fresh process on the same data, and compares what they return
+#(figure json, and the store tables when client side filtering is on). floats may differ in the last bits, the sums
+#are added in another order. a callback that fails on either backend is a failure too, the same error on both is not
+#parity. exits with 1 when any callback fails or any output differs (tests/test_backend_parity.py runs it)
+
+BACKENDS = ['pandas', 'duckdb']
+#relative tolerance for floats
+TOLERANCE = 1e-9
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#worker, the outputs of every callback with the backend of its environment
+
+
+def run_worker(app, data_dir):
+    import plotly
+    os.chdir(data_dir)
+    warnings.simplefilter('ignore')
+    module = __import__(APPS[app]['module'])
+    results = {}
+    errors = {}
+    for output, callback in module.app.callback_map.items():
+        if 'callback' not in callback:
+            continue
+        #the undecorated function, so nothing comes from the figure cache
+        function = inspect.unwrap(callback['callback'])
+        for start_date, end_date in date_ranges():
+            for values in FILTERS[app].get(output, [[]]):
+                args = [start_date, end_date] + list(values)
+                key = '%s %s' % (output, json.dumps(args))
+                try:
+                    results[key] = json.loads(json.dumps(function(*args), cls=plotly.utils.PlotlyJSONEncoder))
+                except Exception as exc:
+                    errors[key] = '%s: %s' % (type(exc).__name__, str(exc)[:200])
+    print(json.dumps({'outputs': results, 'errors': errors}))
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#driver
+
+
+def outputs(app, backend, data_dir, clientside):
+    env = dict(os.environ, DATA_CACHE_DIR=os.path.join(data_dir, 'cache_' + app), SHARED_DATASET_DIR='',
+               FIGURE_CACHE_MAX_ENTRIES='0', SHIPMENT_INGEST_DIR='', PRICING_INGEST_DIR='', CACHE_WARMER='0',
+               CLIENTSIDE_FILTERING='1' if clientside else '', QUERY_BACKEND=backend)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', app, data_dir], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+#paths where reference and other differ
+def differences(reference, other, path=''):
+    if isinstance(reference, float) or isinstance(other, float):
+        if isinstance(reference, (int, float)) and isinstance(other, (int, float)):
+            if math.isclose(reference, other, rel_tol=TOLERANCE) or reference != reference and other != other:
+                return []
+        return [path]
+    if type(reference) != type(other):
+        return [path]
+    if isinstance(reference, dict):
+        if reference.keys() != other.keys():
+            return [path + ' keys']
+        return [found for key in reference for found in differences(reference[key], other[key], path + '.' + key)]
+    if isinstance(reference, list):
+        if len(reference) != len(other):
+            return [path + ' length']
+        return [found for index, (item, other_item) in enumerate(zip(reference, other))
+                for found in differences(item, other_item, '%s[%d]' % (path, index))]
+    return [] if reference == other else [path]
+
+
+#the number of failed callbacks and differing outputs
+def check(apps, data_dir):
+    failed = 0
+    for app in apps:
+        #the client side store only exists in the outbound app
+        for clientside in ([False, True] if app == 'outbound' else [False]):
+            runs = {backend: outputs(app, backend, data_dir, clientside) for backend in BACKENDS}
+            errors = 0
+            for backend, run in runs.items():
+                for key, error in sorted(run['errors'].items()):
+                    errors += 1
+                    print('ERROR %s %s %s: %s' % (app, backend, key, error), file=sys.stderr)
+            reference, other = (runs[backend]['outputs'] for backend in BACKENDS)
+            mismatched = 0
+            for key in sorted(set(reference) | set(other)):
+                if key not in reference or key not in other:
+                    #a callback that failed on one backend only is already counted as an error
+                    continue
+                found = differences(reference[key], other[key])
+                if found:
+                    mismatched += 1
+                    print('MISMATCH %s %s: %s' % (app, key, ', '.join(found[:5])), file=sys.stderr)
+            print(json.dumps({'app': app, 'clientside': clientside, 'outputs': len(reference), 'errors': errors,
+                              'mismatched': mismatched}), file=sys.stderr)
+            failed += errors + mismatched
+    return failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        run_worker(*sys.argv[2:4])
+        sys.exit()
+    parser = argparse.ArgumentParser(description='check that the pandas and duckdb query backends give the same charts')
+    parser.add_argument('--rows', type=int, default=100_000, help='size of the generated data')
+    parser.add_argument('--apps', nargs='+', choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help='existing data to check instead of generated data')
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    if data_dir is None:
+        from benchmarks.synthetic_data import write_dataset
+        data_dir = tempfile.mkdtemp(prefix='backend_parity_')
+        write_dataset(data_dir, args.rows, seed=args.seed)
+    sys.exit(1 if check(args.apps, os.path.abspath(data_dir)) else 0)
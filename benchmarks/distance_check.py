@@ -0,0 +1,54 @@
+import os
+import sys
+import warnings
+
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from distances import DistanceEngine
+from shipping_data import prepare_shipments
+
+#----------------------------------------------------------------------------------------------------------------------
+#distance fill check
+#prepares a few shipments against a small centroid table: one distance comes from the export, one from the centroids
+#and one destination zip has no centroid. the unresolved one has to stay in the frame with 0 miles and the default
+#range, with one warning for it. exits with 1 when it does not
+
+
+def shipments():
+    return pd.DataFrame({
+        'delivery_date': ['2022-11-18 18:55:00'] * 3, 'purchase_time': ['2022-11-11 01:47:00'] * 3,
+        'shipment_service': ['ground'] * 3, 'haversine_distance_miles': [314.01, None, None],
+        'group': ['Group A'] * 3, 'transportmode': ['ground'] * 3, 'fc': ['Location A'] * 3,
+        'product_name': ['Product A'] * 3, 'recipient_state': ['PA'] * 3,
+        'sending_zip_code': [22001, 22001, 22001], 'delivery_zipcode': [10001, 10001, 99999]})
+
+
+def check():
+    engine = DistanceEngine([22001, 10001], [38.8, 40.75], [-77.1, -73.99])
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        frame = prepare_shipments(shipments(), engine)
+    failed = []
+    if len(frame) != 3:
+        failed.append('%d of 3 shipments kept' % len(frame))
+    else:
+        if frame['Shipping_distance'].tolist()[0] != 314:
+            failed.append('the export distance was not kept')
+        if not 150 < frame['Shipping_distance'].tolist()[1] < 250:
+            failed.append('the centroid distance is %s miles' % frame['Shipping_distance'].tolist()[1])
+        if frame['Shipping_distance'].tolist()[2] != 0 or frame['Shipping ranges'].tolist()[2] != 0:
+            failed.append('the unknown zip is not 0 miles in the default range')
+    if sum('no shipping distance' in str(warning.message) for warning in caught) != 1:
+        failed.append('no warning for the unknown zip')
+    return failed
+
+
+if __name__ == '__main__':
+    failed = check()
+    for line in failed:
+        print('FAILED ' + line, file=sys.stderr)
+    print('distance fill: %s' % ('failed' if failed else 'ok'), file=sys.stderr)
+    sys.exit(1 if failed else 0)
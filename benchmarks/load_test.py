@@ -0,0 +1,340 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks.run_benchmarks import APPS, date_ranges, git_commit
+
+#----------------------------------------------------------------------------------------------------------------------
+#concurrent user load test
+#starts one app as a local server on synthetic data and replays analyst sessions against it through the same http
+#requests the browser makes: the page load fires every callback with the layout defaults, then every virtual user
+#alternates date picker changes (a preset range, or a sweep of the range a week at a time), dropdown changes and
+#think time. every user keeps its own cookies (and client id) and, like a browser, sends the callbacks an input change
+#triggers in parallel over at most BROWSER_CONNECTIONS connections. the virtual users are ramped up in stages and
+#every stage reports throughput and per output latency percentiles, error and superseded rates. --max-p95-ms and
+#--max-error-rate make it exit with 1 when a stage is over, to gate performance changes
+
+#date picker and the dropdowns the sessions change, per app
+SESSIONS = {
+    'outbound': {'picker': 'my-date-picker-range', 'dropdowns': ['dropdown_plants_flowers']},
+    'pricing': {'picker': 'date_picker', 'dropdowns': ['from_column_dropdown_state', 'from_column_dropdown_zip']},
+}
+#what a user does next: pick a preset range, sweep the range, change a dropdown
+ACTIONS = [('range', 0.35), ('sweep', 0.15), ('dropdown', 0.5)]
+SWEEP_STEPS = 4
+#parallel requests per host of a browser over http/1.1
+BROWSER_CONNECTIONS = 6
+FIRST_DAY, LAST_DAY = datetime.date(2022, 1, 1), datetime.date(2022, 12, 31)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#server, the app in its own process
+
+
+def serve(app, data_dir, port):
+    os.chdir(data_dir)
+    warnings.simplefilter('ignore')
+    module = __import__(APPS[app]['module'])
+    module.app.run(host='127.0.0.1', port=int(port), debug=False, threaded=True)
+
+
+def start_server(app, data_dir, port, settings, timeout):
+    import requests
+    env = dict(os.environ, DATA_CACHE_DIR=os.path.join(data_dir, 'cache_' + app), SHIPMENT_INGEST_DIR='',
+               PRICING_INGEST_DIR='')
+    env.update(settings)
+    log = open(os.path.join(data_dir, 'server_%s.log' % app), 'w')
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', app, data_dir, str(port)],
+                              env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = 'http://127.0.0.1:%d' % port
+    start = time.perf_counter()
+    #/health answers 200 once the app is up and its figure cache warmed
+    while time.perf_counter() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError('the %s server exited, see %s' % (app, log.name))
+        try:
+            if requests.get(url + '/health', timeout=5).status_code == 200:
+                return server, url, time.perf_counter() - start
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError('the %s server was not ready after %ds' % (app, timeout))
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#sessions
+
+
+def _components(layout, found):
+    if isinstance(layout, list):
+        for child in layout:
+            _components(child, found)
+    elif isinstance(layout, dict) and 'props' in layout:
+        if 'id' in layout['props']:
+            found[layout['props']['id']] = layout['props']
+        _components(layout['props'].get('children'), found)
+    return found
+
+
+def _output_spec(output):
+    #multi output callbacks are '..a.children...b.children..'
+    if output.startswith('..'):
+        return [_output_spec(part) for part in output[2:-2].split('...')]
+    component, prop = output.rsplit('.', 1)
+    return {'id': component, 'property': prop}
+
+
+class Dashboard:
+
+    #the server callbacks and the default component values, read the way the browser reads them
+    def __init__(self, url, app):
+        import requests
+        self.url = url
+        layout = requests.get(url + '/_dash-layout', timeout=30).json()
+        self.components = _components(layout, {})
+        self.callbacks = [callback for callback in requests.get(url + '/_dash-dependencies', timeout=30).json()
+                          if not callback.get('clientside_function')]
+        self.picker = SESSIONS[app]['picker']
+        self.dropdowns = {dropdown: [option['value'] if isinstance(option, dict) else option
+                                     for option in self.components[dropdown].get('options', [])]
+                          for dropdown in SESSIONS[app]['dropdowns'] if dropdown in self.components}
+
+    def defaults(self):
+        return {(component, prop): value for component, props in self.components.items()
+                for prop, value in props.items()}
+
+    def triggered(self, changed):
+        return [callback for callback in self.callbacks
+                if changed is None or any((item['id'], item['property']) in changed for item in callback['inputs'])]
+
+    @staticmethod
+    def body(callback, values, changed):
+        def items(specs):
+            return [{'id': item['id'], 'property': item['property'], 'value': values.get((item['id'],
+                                                                                          item['property']))}
+                    for item in specs]
+        return {'output': callback['output'], 'outputs': _output_spec(callback['output']),
+                'inputs': items(callback['inputs']), 'state': items(callback['state']),
+                'changedPropIds': ['%s.%s' % key for key in changed or []
+                                   if any((item['id'], item['property']) == key for item in callback['inputs'])]}
+
+
+class Recorder:
+
+    def __init__(self):
+        self.stage = None
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    #(stage, output, seconds, outcome), outcome is ok, superseded (204, a newer request of the user replaced it)
+    #or error
+    def add(self, stage, output, seconds, outcome):
+        with self._lock:
+            self.samples[stage].append((output, seconds, outcome))
+
+
+class VirtualUser(threading.Thread):
+
+    def __init__(self, number, dashboard, recorder, stop, think, seed):
+        super().__init__(daemon=True, name='user-%d' % number)
+        self.dashboard = dashboard
+        self.recorder = recorder
+        self.stop = stop
+        self.think = think
+        self.random = random.Random(seed)
+        self.ranges = list(date_ranges())
+        self.browser = ThreadPoolExecutor(BROWSER_CONNECTIONS)
+
+    def run(self):
+        import requests
+        self.session = requests.Session()
+        self.values = self.dashboard.defaults()
+        #page load: the browser fires every callback with the layout values
+        self.fire(None)
+        while not self.stop.is_set():
+            self.pause(self.think)
+            if self.stop.is_set():
+                break
+            action = self.random.choices([name for name, _ in ACTIONS], [weight for _, weight in ACTIONS])[0]
+            if action == 'dropdown' and self.dashboard.dropdowns:
+                dropdown = self.random.choice(sorted(self.dashboard.dropdowns))
+                self.change({(dropdown, 'value'): self.random.choice(self.dashboard.dropdowns[dropdown])})
+            elif action == 'sweep':
+                #the range moved a week at a time, the next step before the last answers arrive
+                start, end = (datetime.date.fromisoformat(str(self.values[(self.dashboard.picker, prop)])[:10])
+                              for prop in ('start_date', 'end_date'))
+                for _ in range(SWEEP_STEPS):
+                    start, end = start + datetime.timedelta(days=7), end + datetime.timedelta(days=7)
+                    if end > LAST_DAY:
+                        #past the end of the data, the sweep starts over at its beginning
+                        start, end = FIRST_DAY, FIRST_DAY + (end - start)
+                    self.change({(self.dashboard.picker, 'start_date'): start.isoformat(),
+                                 (self.dashboard.picker, 'end_date'): end.isoformat()}, wait=False)
+                    self.pause(self.think / 10)
+            else:
+                start, end = self.random.choice(self.ranges)
+                self.change({(self.dashboard.picker, 'start_date'): start, (self.dashboard.picker, 'end_date'): end})
+        self.browser.shutdown(wait=True)
+
+    def pause(self, mean):
+        if mean > 0:
+            self.stop.wait(self.random.expovariate(1 / mean))
+
+    def change(self, values, wait=True):
+        self.values.update(values)
+        self.fire(set(values), wait)
+
+    def fire(self, changed, wait=True):
+        futures = [self.browser.submit(self.request, callback, dict(self.values), changed)
+                   for callback in self.dashboard.triggered(changed)]
+        if wait:
+            for future in futures:
+                future.result()
+
+    def request(self, callback, values, changed):
+        stage = self.recorder.stage
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.dashboard.url + '/_dash-update-component',
+                                         json=Dashboard.body(callback, values, changed), timeout=300)
+            outcome = {200: 'ok', 204: 'superseded'}.get(response.status_code, 'error')
+        except Exception:
+            outcome = 'error'
+        self.recorder.add(stage, callback['output'], time.perf_counter() - start, outcome)
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#report
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    ms = np.array(seconds) * 1000
+    return {'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)), 'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max())}
+
+
+def summarize(samples, seconds):
+    def stats(rows):
+        answered = [took for _, took, outcome in rows if outcome == 'ok']
+        errors = sum(outcome == 'error' for _, _, outcome in rows)
+        return dict({'requests': len(rows), 'ok': len(answered), 'superseded': len(rows) - len(answered) - errors,
+                     'errors': errors, 'error_rate': errors / len(rows) if rows else 0.0,
+                     'throughput_rps': len(answered) / seconds}, **percentiles(answered))
+    outputs = defaultdict(list)
+    for row in samples:
+        outputs[row[0]].append(row)
+    return dict(stats(samples), outputs={output: stats(rows) for output, rows in sorted(outputs.items())})
+
+
+def run(app, data_dir, stages, stage_seconds, think, settings, seed, timeout):
+    port = free_port()
+    server, url, ready = start_server(app, data_dir, port, settings, timeout)
+    recorder = Recorder()
+    stop = threading.Event()
+    users = []
+    report = {'app': app, 'ready_s': ready, 'settings': settings, 'stages': []}
+    try:
+        dashboard = Dashboard(url, app)
+        for stage, count in enumerate(stages):
+            recorder.stage = stage
+            #ramp up to count users, spread over the first tenth of the stage
+            new = count - len(users)
+            for number in range(len(users), count):
+                user = VirtualUser(number, dashboard, recorder, stop, think, seed * 100003 + number)
+                user.start()
+                users.append(user)
+                time.sleep(stage_seconds / 10 / max(new, 1))
+            time.sleep(stage_seconds * 0.9)
+            record = dict({'users': count, 'seconds': stage_seconds}, **summarize(recorder.samples[stage],
+                                                                                     stage_seconds))
+            report['stages'].append(record)
+            print(json.dumps({'app': app, 'users': count, 'rps': round(record['throughput_rps'], 2),
+                              'p95_ms': round(record.get('p95_ms', 0), 1), 'error_rate': record['error_rate']}),
+                  file=sys.stderr)
+    finally:
+        stop.set()
+        for user in users:
+            user.join(timeout=60)
+        server.terminate()
+        server.wait()
+    return report
+
+
+def over_limits(report, max_p95_ms, max_error_rate):
+    failed = []
+    for result in report['results']:
+        for stage in result['stages']:
+            if max_p95_ms is not None and stage.get('p95_ms', 0) > max_p95_ms:
+                failed.append('%s at %d users: p95 %.0fms' % (result['app'], stage['users'], stage['p95_ms']))
+            if max_error_rate is not None and stage['error_rate'] > max_error_rate:
+                failed.append('%s at %d users: error rate %.3f' % (result['app'], stage['users'],
+                                                                   stage['error_rate']))
+    return failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(*sys.argv[2:5])
+        sys.exit()
+    parser = argparse.ArgumentParser(description='ramp up concurrent virtual users against a local dashboard server')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='size of the generated data')
+    parser.add_argument('--apps', nargs='+', choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 5, 10, 25, 50],
+                        help='concurrent users of every stage, in ramp order')
+    parser.add_argument('--stage-seconds', type=float, default=60)
+    parser.add_argument('--think', type=float, default=3, help='mean seconds a user waits between actions')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='setting for the server, e.g. --set QUERY_BACKEND=duckdb (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=None, help='existing data to serve instead of generated data')
+    parser.add_argument('--startup-timeout', type=int, default=600)
+    parser.add_argument('--max-p95-ms', type=float, default=None, help='fail when a stage has a higher p95')
+    parser.add_argument('--max-error-rate', type=float, default=None, help='fail when a stage has more errors')
+    parser.add_argument('--out', default='load_test_output.json', help='json results file')
+    args = parser.parse_args()
+    import pandas as pd
+    data_dir = args.data_dir
+    if data_dir is None:
+        from benchmarks.synthetic_data import write_dataset
+        data_dir = tempfile.mkdtemp(prefix='dashboard_load_')
+        write_dataset(data_dir, args.rows, seed=args.seed)
+    settings = dict(item.split('=', 1) for item in args.set)
+    report = {'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                       'python': platform.python_version(), 'pandas': pd.__version__, 'machine': platform.machine(),
+                       'cpus': os.cpu_count(), 'rows': args.rows if args.data_dir is None else None,
+                       'think_s': args.think, 'seed': args.seed},
+              'results': [run(app, os.path.abspath(data_dir), args.users, args.stage_seconds, args.think, settings,
+                              args.seed, args.startup_timeout) for app in args.apps]}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('results written to %s' % args.out, file=sys.stderr)
+    failed = over_limits(report, args.max_p95_ms, args.max_error_rate)
+    for line in failed:
+        print('OVER LIMIT ' + line, file=sys.stderr)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,236 @@
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+#----------------------------------------------------------------------------------------------------------------------
+#benchmark suite for both dashboards
+#for every data size: generate seeded synthetic inputs, then in fresh processes time data preparation, the columnar
+#cache, app startup (cold and from the cache) and every build_graph callback over date range and filter sweeps.
+#peak memory is the max rss of the measuring process. results are written as json, one record per measurement.
+#callback failures are recorded with their exception, one that is not a known case (KNOWN_ERRORS) exits with 1
+
+APPS = {
+    'outbound': {'module': 'outbound_shipping_DB', 'cache': 'df5', 'sources': ['dummy_data.csv']},
+    'pricing': {'module': 'pricing_example', 'cache': 'pricing_df_2',
+                'sources': ['check_zipcode_2_data.csv', 'vendor_A_data.csv', 'vendor_B_data.csv']},
+}
+
+#date ranges a user typically picks: a week, a month, a quarter and the whole year, at a few positions
+RANGE_DAYS = [7, 31, 92, 365]
+RANGE_STARTS = ['2022-01-03', '2022-04-01', '2022-07-01', '2022-10-01']
+
+#values swept for the non date inputs, per output
+FILTERS = {
+    'outbound': {
+        'Bar5_v1.children': [[]],
+        'Bar1.children': [['Group A'], ['Group B'], ['Group C'], ['Group D']],
+        'Bar2.children': [['Group A'], ['Group B'], ['Group C'], ['Group D']],
+        'Scat1.children': [['Group A'], ['Group B']],
+        'Bar3.children': [['Group A'], ['Group B'], ['Group C'], ['Group D']],
+        'Bar4.children': [['Group A'], ['Group B'], ['Group C'], ['Group D']],
+        'Bar6.children': [['Product A'], ['Product B'], ['Product C']],
+        'cholro_1.children': [['Product B', 'Location B', 'express'], ['Product A', 'Location A', 'ground']],
+        'sun_1.children': [['Product A'], ['Product B']],
+    },
+    'pricing': {
+        'Bar1.children': [[]],
+        'Bar2.children': [['Ohio'], ['California'], ['Texas']],
+        'scatter3.children': [[]],
+        'Chloro_4.children': [[22001], [22009], [23589]],
+        'sun_5.children': [[]],
+    },
+}
+
+#callback failures that are not regressions: plotly express divides by the summed values of a sunburst branch to
+#color it, a branch whose values sum to zero raises. every other failure fails the run
+KNOWN_ERRORS = {
+    'sun_1.children': (ZeroDivisionError,),
+    'sun_5.children': (ZeroDivisionError,),
+}
+#failures listed per callback in the results, the count covers all of them
+MAX_FAILURES = 20
+
+
+def peak_rss_mb():
+    #ru_maxrss is kilobytes on linux, bytes on macos
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def date_ranges():
+    for days in RANGE_DAYS:
+        for start in RANGE_STARTS:
+            first = np.datetime64(start)
+            last = min(first + np.timedelta64(days - 1, 'D'), np.datetime64('2022-12-31'))
+            yield str(first), str(last)
+
+
+#failures are dicts with the arguments, exception type and message of a failed call and whether it is known
+def summarize(seconds, failures=()):
+    failures = list(failures)
+    summary = {'calls': len(seconds), 'errors': len(failures),
+               'unexpected_errors': sum(not failure['known'] for failure in failures)}
+    if failures:
+        summary['failures'] = failures[:MAX_FAILURES]
+    if seconds:
+        ms = np.array(seconds) * 1000
+        summary.update({'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+                        'p95_ms': float(np.percentile(ms, 95)), 'max_ms': float(ms.max())})
+    return summary
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#measurements, each one runs in its own process started by run_worker
+
+
+def measure_prepare(app):
+    from data_cache import read_cache, write_cache
+    if app == 'outbound':
+        from shipping_data import load_shipments
+        start = time.perf_counter()
+        frame = load_shipments('dummy_data.csv')
+    else:
+        from pricing_data import load_pricing
+        start = time.perf_counter()
+        frame = load_pricing('check_zipcode_2_data.csv')
+    prepare = time.perf_counter() - start
+    start = time.perf_counter()
+    write_cache(APPS[app]['cache'], frame, APPS[app]['sources'])
+    cache_write = time.perf_counter() - start
+    start = time.perf_counter()
+    read_cache(APPS[app]['cache'], APPS[app]['sources'])
+    cache_read = time.perf_counter() - start
+    return {'prepare_s': prepare, 'cache_write_s': cache_write, 'cache_read_s': cache_read, 'rows': len(frame),
+            'frame_mb': frame.memory_usage(deep=True).sum() / 2 ** 20}
+
+
+def measure_startup(app):
+    start = time.perf_counter()
+    __import__(APPS[app]['module'])
+    return {'startup_s': time.perf_counter() - start}
+
+
+def measure_callbacks(app):
+    module = __import__(APPS[app]['module'])
+    results = {}
+    for output, filters in FILTERS[app].items():
+        #the undecorated build_graph function, so every call computes
+        callback = inspect.unwrap(module.app.callback_map[output]['callback'])
+        seconds = []
+        failures = []
+        for start_date, end_date in date_ranges():
+            for values in filters:
+                args = [start_date, end_date] + list(values)
+                start = time.perf_counter()
+                try:
+                    callback(*args)
+                except Exception as exc:
+                    #recorded, not timed
+                    failures.append({'args': args, 'type': type(exc).__name__, 'message': str(exc)[:200],
+                                     'known': isinstance(exc, KNOWN_ERRORS.get(output, ()))})
+                    continue
+                seconds.append(time.perf_counter() - start)
+        results[output] = summarize(seconds, failures)
+    return {'callbacks': results}
+
+
+MEASUREMENTS = {'prepare': measure_prepare, 'startup': measure_startup, 'callbacks': measure_callbacks}
+
+
+def run_worker(app, measurement, data_dir):
+    os.chdir(data_dir)
+    warnings.simplefilter('ignore')
+    result = MEASUREMENTS[measurement](app)
+    result['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#driver
+
+
+def measure(app, measurement, data_dir, cache_dir):
+    env = dict(os.environ, DATA_CACHE_DIR=cache_dir, SHARED_DATASET_DIR='', FIGURE_CACHE_MAX_ENTRIES='0',
+               SHIPMENT_INGEST_DIR='', PRICING_INGEST_DIR='', CLIENTSIDE_FILTERING='', CACHE_WARMER='0')
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', app, measurement, data_dir],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', '-C', REPO, 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, apps, work_dir, seed):
+    import pandas as pd
+    from benchmarks.synthetic_data import write_dataset
+    report = {'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                       'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                       'machine': platform.machine(), 'cpus': os.cpu_count(), 'seed': seed},
+              'results': []}
+    for rows in sizes:
+        data_dir = os.path.join(work_dir, 'rows_%d' % rows)
+        start = time.perf_counter()
+        write_dataset(data_dir, rows, seed=seed)
+        print('generated %d rows in %.1fs' % (rows, time.perf_counter() - start), file=sys.stderr)
+        for app in apps:
+            cache_dir = os.path.join(data_dir, 'cache_' + app)
+            record = {'app': app, 'rows': rows}
+            record['prepare'] = measure(app, 'prepare', data_dir, cache_dir)
+            #cold: no cache, the app reads and prepares the csv. warm: the app loads the cache written by the cold run
+            cold_cache = os.path.join(data_dir, 'cold_cache_' + app)
+            record['startup_cold'] = measure(app, 'startup', data_dir, cold_cache)
+            record['startup_warm'] = measure(app, 'startup', data_dir, cold_cache)
+            record['callbacks'] = measure(app, 'callbacks', data_dir, cold_cache)
+            report['results'].append(record)
+            print(json.dumps({'app': app, 'rows': rows, 'startup_warm_s': record['startup_warm']['startup_s']}),
+                  file=sys.stderr)
+    return report
+
+
+#callbacks whose failures are not in KNOWN_ERRORS, as 'app rows output: count'
+def unexpected_errors(report):
+    return ['%s %d %s: %d' % (record['app'], record['rows'], output, summary['unexpected_errors'])
+            for record in report['results'] for output, summary in record['callbacks']['callbacks'].items()
+            if summary['unexpected_errors']]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        run_worker(*sys.argv[2:5])
+        sys.exit()
+    parser = argparse.ArgumentParser(description='benchmark data preparation, startup and callbacks of both apps')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000],
+                        help='data sizes to run, e.g. --rows 100000 1000000 10000000 50000000')
+    parser.add_argument('--apps', nargs='+', choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help='where the generated data goes (default: a temp dir)')
+    parser.add_argument('--out', default='bench_output.json', help='json results file')
+    args = parser.parse_args()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='dashboard_bench_')
+    report = run(args.rows, args.apps, work_dir, args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('results written to %s' % args.out, file=sys.stderr)
+    failed = unexpected_errors(report)
+    for line in failed:
+        print('FAILED callback errors in %s (see failures in the results)' % line, file=sys.stderr)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,146 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+#----------------------------------------------------------------------------------------------------------------------
+#seeded synthetic data for both dashboards
+#writes dummy_data.csv (outbound shipping), check_zipcode_2_data.csv (pricing) and one rate card per vendor
+#(vendor_A_data.csv, vendor_B_data.csv, ...) with the columns the apps read. rows are generated and written in chunks
+#so 50M rows do not have to fit in memory
+
+STATES = [('California', 'CA', 900), ('Texas', 'TX', 750), ('Florida', 'FL', 330), ('New York', 'NY', 100),
+          ('Pennsylvania', 'PA', 150), ('Illinois', 'IL', 600), ('Ohio', 'OH', 430), ('Georgia', 'GA', 300),
+          ('North Carolina', 'NC', 270), ('Michigan', 'MI', 480), ('New Jersey', 'NJ', 70), ('Virginia', 'VA', 220),
+          ('Washington', 'WA', 980), ('Arizona', 'AZ', 850), ('Massachusetts', 'MA', 10), ('Tennessee', 'TN', 370),
+          ('Indiana', 'IN', 460), ('Missouri', 'MO', 630), ('Maryland', 'MD', 206), ('Wisconsin', 'WI', 530),
+          ('Colorado', 'CO', 800), ('Minnesota', 'MN', 550), ('South Carolina', 'SC', 290), ('Alabama', 'AL', 350),
+          ('Louisiana', 'LA', 700), ('Kentucky', 'KY', 400), ('Oregon', 'OR', 970), ('Oklahoma', 'OK', 730),
+          ('Connecticut', 'CT', 60), ('Utah', 'UT', 840)]
+#share of the population per state above, used as the destination mix
+STATE_WEIGHTS = np.array([39, 29, 22, 20, 13, 12.8, 11.8, 10.7, 10.4, 10, 9.3, 8.6, 7.7, 7.2, 7, 6.9, 6.8, 6.2, 6.2,
+                          5.9, 5.8, 5.7, 5.1, 5, 4.7, 4.5, 4.2, 4, 3.6, 3.3])
+STATE_WEIGHTS = STATE_WEIGHTS / STATE_WEIGHTS.sum()
+
+GROUPS = ['Group A', 'Group B', 'Group C', 'Group D']
+PRODUCTS = ['Product A', 'Product B', 'Product C', 'Product D', 'Product E']
+FCS = ['Location A', 'Location B', 'Location C']
+FC_ZIPS = [22001, 22009, 23589]
+#transport mode, share, (min, max) days in transit
+MODES = [('ground', 0.55, (2, 7)), ('express', 0.35, (1, 3)), ('same_day', 0.10, (0, 1))]
+
+START = np.datetime64('2022-01-01T00:00')
+DAYS = 365
+CHUNK = 1_000_000
+
+
+def destination_zips(rng, count=4000):
+    #a few thousand destination zips, each in the three digit prefix range of its state
+    state = rng.choice(len(STATES), count, p=STATE_WEIGHTS)
+    prefix = np.array([STATES[i][2] for i in state])
+    zips = prefix * 100 + rng.integers(0, 100, count)
+    zips, first = np.unique(zips, return_index=True)
+    return zips, state[first]
+
+
+def rate_cards(rng, zips, vendors=2):
+    #one price per (fc zip, destination zip) and vendor, the first vendor is usually the cheapest
+    lanes = pd.MultiIndex.from_product([FC_ZIPS, zips], names=['sending_zip', 'receiving_zip']).to_frame(index=False)
+    cards = {}
+    for vendor in range(vendors):
+        name = 'vendor_' + chr(ord('A') + vendor)
+        base = 13 + 3 * vendor + (lanes['receiving_zip'] // 10000 - 5).abs() * 0.2
+        price = np.round(base + rng.normal(0, 0.8, len(lanes))).clip(5, None)
+        cards[name] = lanes.assign(vendor=name, **{name + '_pricing': price})[
+            ['vendor', 'sending_zip', 'receiving_zip', name + '_pricing']]
+    return cards
+
+
+def shipments_chunk(rng, rows):
+    mode = rng.choice(len(MODES), rows, p=[share for _, share, _ in MODES])
+    low = np.array([MODES[i][2][0] for i in mode])
+    high = np.array([MODES[i][2][1] for i in mode])
+    purchase = START + rng.integers(0, DAYS * 24 * 60, rows).astype('timedelta64[m]')
+    transit_minutes = ((low + rng.random(rows) * (high - low)) * 24 * 60).astype('int64')
+    delivery = purchase + transit_minutes.astype('timedelta64[m]')
+    service = np.array([MODES[i][0] for i in mode], dtype=object)
+    #a few missing and cancelled ('0') services like the real export
+    service[rng.random(rows) < 0.02] = np.nan
+    service[rng.random(rows) < 0.01] = '0'
+    states = np.array([abbr for _, abbr, _ in STATES])
+    return pd.DataFrame({
+        'delivery_date': pd.Series(delivery).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'purchase_time': pd.Series(purchase).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'shipment_service': service,
+        'haversine_distance_miles': np.round(rng.gamma(1.6, 220, rows), 2),
+        'group': rng.choice(GROUPS, rows, p=[0.4, 0.3, 0.2, 0.1]),
+        'transportmode': np.array([MODES[i][0] for i in mode]),
+        'fc': rng.choice(FCS, rows, p=[0.5, 0.3, 0.2]),
+        'product_name': rng.choice(PRODUCTS, rows, p=[0.3, 0.25, 0.2, 0.15, 0.1]),
+        'recipient_state': states[rng.choice(len(STATES), rows, p=STATE_WEIGHTS)],
+    })
+
+
+def pricing_chunk(rng, rows, zips, zip_states, cards, first_id, missing_lanes=0.0):
+    destination = rng.integers(0, len(zips), rows)
+    sending = rng.choice(FC_ZIPS, rows, p=[0.5, 0.3, 0.2])
+    delivery_zip = zips[destination]
+    #optionally some shipments go to a lane no vendor prices
+    delivery_zip = np.where(rng.random(rows) < missing_lanes, 99999, delivery_zip)
+    state = zip_states[destination]
+    vendor_a = next(iter(cards.values()))
+    lane_price = vendor_a.set_index(['sending_zip', 'receiving_zip']).iloc[:, -1]
+    paid = lane_price.reindex(pd.MultiIndex.from_arrays([sending, zips[destination]])).to_numpy()
+    paid = np.round(paid + rng.choice([-1, 0, 0, 1, 2, 3], rows))
+    purchase = START + rng.integers(0, DAYS * 24 * 60, rows).astype('timedelta64[m]')
+    return pd.DataFrame({
+        'order_id': np.arange(first_id, first_id + rows),
+        'sending_zip_code': sending,
+        'delivery_zipcode': delivery_zip,
+        'shipping_price': paid,
+        'purchase_time_index': pd.Series(purchase).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'state': np.array([STATES[i][0] for i in state]),
+        'state_abbr': np.array([STATES[i][1] for i in state]),
+        'county': np.char.add('County ', (delivery_zip % 7).astype(str)),
+        'product': rng.choice(PRODUCTS, rows, p=[0.3, 0.25, 0.2, 0.15, 0.1]),
+    })
+
+
+def write_dataset(directory, shipments=100_000, pricing=None, vendors=2, seed=0, missing_lanes=0.0):
+    pricing = shipments if pricing is None else pricing
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    zips, zip_states = destination_zips(rng)
+    cards = rate_cards(rng, zips, vendors)
+    for name, card in cards.items():
+        card.to_csv(os.path.join(directory, name + '_data.csv'), index=False)
+
+    written = 0
+    with open(os.path.join(directory, 'dummy_data.csv'), 'w', newline='') as f:
+        while written < shipments:
+            rows = min(CHUNK, shipments - written)
+            shipments_chunk(rng, rows).to_csv(f, index=False, header=written == 0)
+            written += rows
+
+    written = 0
+    with open(os.path.join(directory, 'check_zipcode_2_data.csv'), 'w', newline='') as f:
+        while written < pricing:
+            rows = min(CHUNK, pricing - written)
+            chunk = pricing_chunk(rng, rows, zips, zip_states, cards, written, missing_lanes)
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += rows
+    return [name + '_data.csv' for name in cards]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write seeded synthetic input files for both dashboards')
+    parser.add_argument('directory')
+    parser.add_argument('--rows', type=int, default=100_000, help='outbound shipments')
+    parser.add_argument('--pricing-rows', type=int, default=None, help='priced shipments (default: --rows)')
+    parser.add_argument('--vendors', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--missing-lanes', type=float, default=0.0,
+                        help='share of priced shipments on a lane no vendor prices')
+    args = parser.parse_args()
+    write_dataset(args.directory, args.rows, args.pricing_rows, args.vendors, args.seed, args.missing_lanes)
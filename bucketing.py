@@ -0,0 +1,44 @@
+import numpy as np
+
+#----------------------------------------------------------------------------------------------------------------------
+#declarative bucketing of numeric columns
+#a scheme is a list of sorted edges and one label per bin. bins are contiguous, (edges[i], edges[i + 1]] with the first
+#one also holding edges[0], so every value from edges[0] to edges[-1] lands in exactly one bin and there are no gaps
+#between them. values outside the edges (and nan) get the default label. a column is bucketed with one binary search
+#over the edges instead of one boolean mask per bin
+
+
+class BucketScheme:
+
+    def __init__(self, edges, labels, default):
+        edges = np.asarray(edges, dtype=float)
+        if len(labels) != len(edges) - 1:
+            raise ValueError('%d edges need %d labels, got %d' % (len(edges), len(edges) - 1, len(labels)))
+        if (np.diff(edges) <= 0).any():
+            raise ValueError('bucket edges must be strictly increasing')
+        self.edges = edges
+        self.labels = list(labels)
+        self.default = default
+        #the default label is looked up at position len(labels)
+        self._lookup = np.asarray(self.labels + [default])
+
+    def __repr__(self):
+        return 'BucketScheme(%r, %r, default=%r)' % (self.edges.tolist(), self.labels, self.default)
+
+    #bin number per value, len(labels) for values outside the edges
+    def codes(self, values):
+        values = np.asarray(values, dtype=float)
+        codes = np.searchsorted(self.edges[1:-1], values, side='left')
+        outside = ~((values >= self.edges[0]) & (values <= self.edges[-1]))
+        codes[outside] = len(self.labels)
+        return codes
+
+    def apply(self, values):
+        return self._lookup[self.codes(values)]
+
+
+#derived column -> (source column, scheme), applied in order so a derived column can be the source of a later one
+def add_buckets(df, buckets):
+    for column, (source, scheme) in buckets.items():
+        df[column] = scheme.apply(df[source].to_numpy())
+    return df
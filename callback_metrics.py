@@ -0,0 +1,184 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+
+import flask
+
+from background import checkpoint
+
+#----------------------------------------------------------------------------------------------------------------------
+#per phase callback instrumentation
+#a trace is started for every _dash-update-component request. the data layer marks its work with phase('slice') and
+#phase('groupby'), the instrumented callback measures its total time and whatever it did not spend in a marked phase
+#is counted as 'figure' (filtering and building the plotly figure). the time between the callback returning and the
+#response leaving flask is 'serialize' ('compress' when the response is compressed). timings, row counts and response
+#bytes (before and after compression) go into histograms per callback output which /metrics serves in the prometheus
+#text format. slow requests can be written to a json lines trace log
+
+_trace = contextvars.ContextVar('callback_trace', default=None)
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+BYTES_BUCKETS = (1000, 10 ** 4, 5 * 10 ** 4, 10 ** 5, 5 * 10 ** 5, 10 ** 6, 5 * 10 ** 6, 10 ** 7)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            position = len(self.buckets)
+        self.counts[position] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        out = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += count
+            out.append('%s_bucket{%sle="%s"} %d' % (name, labels, bound, cumulative))
+        out.append('%s_sum{%s} %r' % (name, labels.rstrip(','), self.sum))
+        out.append('%s_count{%s} %d' % (name, labels.rstrip(','), self.count))
+        return out
+
+
+class _Phase:
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.trace['stack'].append(0.0)
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        #time spent in nested phases is counted there, not here
+        nested = self.trace['stack'].pop()
+        if self.trace['stack']:
+            self.trace['stack'][-1] += elapsed
+        phases = self.trace['phases']
+        phases[self.name] = phases.get(self.name, 0.0) + elapsed - nested
+        if self.rows is not None:
+            self.trace['rows'][self.name] = self.trace['rows'].get(self.name, 0) + self.rows
+
+
+class _NoPhase:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def phase(name):
+    #marks a block of data work, set .rows on the returned object to record how many rows it handled.
+    #a phase start is also where a superseded background job stops
+    checkpoint()
+    trace = _trace.get()
+    return _NoPhase() if trace is None else _Phase(trace, name)
+
+
+class CallbackMetrics:
+
+    def __init__(self, trace_log=None, slow_seconds=1.0):
+        self.trace_log = trace_log
+        self.slow_seconds = slow_seconds
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    #wraps a callback so its total time (cache hits included) is measured inside the request trace
+    def instrument(self, func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            trace = _trace.get()
+            if trace is None:
+                return func(*args)
+            with _Phase(trace, 'figure'):
+                return func(*args)
+        return wrapper
+
+    def _before_request(self):
+        if flask.request.path.endswith('/_dash-update-component'):
+            flask.g.callback_trace_token = _trace.set({'start': time.perf_counter(), 'stack': [], 'phases': {},
+                                                       'rows': {}})
+
+    def _after_request(self, response):
+        token = flask.g.pop('callback_trace_token', None)
+        if token is None:
+            return response
+        trace = _trace.get()
+        _trace.reset(token)
+        total = time.perf_counter() - trace['start']
+        body = flask.request.get_json(silent=True) or {}
+        output = body.get('output', 'unknown')
+        labels = {'output': output}
+        phases = dict(trace['phases'])
+        phases['serialize'] = max(total - sum(phases.values()), 0.0)
+        wire = response.calculate_content_length() or 0
+        #the size before compression when the response was compressed (see compression.py)
+        payload = flask.g.pop('uncompressed_bytes', wire)
+        for name, seconds in phases.items():
+            self.observe('dash_callback_phase_seconds', dict(labels, phase=name), seconds, SECONDS_BUCKETS)
+        for name, rows in trace['rows'].items():
+            self.observe('dash_callback_rows', dict(labels, phase=name), rows, ROWS_BUCKETS)
+        self.observe('dash_callback_seconds', labels, total, SECONDS_BUCKETS)
+        self.observe('dash_callback_response_bytes', labels, payload, BYTES_BUCKETS)
+        self.observe('dash_callback_wire_bytes', labels, wire, BYTES_BUCKETS)
+        if self.trace_log and total >= self.slow_seconds:
+            record = {'time': time.time(), 'output': output, 'seconds': total, 'phases': phases,
+                      'rows': trace['rows'], 'bytes': payload, 'wire_bytes': wire,
+                      'status': response.status_code,
+                      'inputs': [item.get('value') for item in body.get('inputs', [])]}
+            with self._lock, open(self.trace_log, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        return response
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append('# TYPE %s histogram' % name)
+                typed.add(name)
+            label_text = ''.join('%s="%s",' % (key, str(value).replace('"', '\\"')) for key, value in labels)
+            lines += histogram.lines(name, label_text)
+        for prefix, collect in self.gauges.items():
+            for key, value in sorted(collect().items()):
+                lines.append('# TYPE %s_%s gauge' % (prefix, key))
+                lines.append('%s_%s %r' % (prefix, key, value))
+        return '\n'.join(lines) + '\n'
+
+    #hooks the request trace into the dash flask server and adds the /metrics route
+    def register(self, app):
+        server = app.server
+        server.before_request(self._before_request)
+        server.after_request(self._after_request)
+        server.add_url_rule('/metrics', 'metrics', lambda: flask.Response(self.render(),
+                                                                          mimetype='text/plain; version=0.0.4'))
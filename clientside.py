@@ -0,0 +1,52 @@
+import json
+
+import pandas as pd
+import plotly.io as pio
+from dash import dcc
+from dash.dependencies import Input, Output, State
+
+#----------------------------------------------------------------------------------------------------------------------
+#client side filtering
+#the server sends the pre-aggregated tables of a date range once into a dcc.Store, column oriented with the string and
+#categorical columns dictionary encoded (distinct values once, then one small integer per row). dropdown changes are
+#handled by the functions in assets/clientside_filters.js, which filter those tables and build the figures in the
+#browser without a round trip to the server
+
+#plotly template of the server side figures, sent once so the browser figures look the same
+TEMPLATE_STORE = 'figure_template'
+
+
+def encode_columns(table):
+    columns = {}
+    for column in table.columns:
+        values = table[column]
+        if values.dtype == 'category' or values.dtype == object:
+            #missing values are code -1
+            codes, uniques = pd.factorize(values)
+            columns[column] = {'values': list(uniques), 'codes': codes.tolist()}
+        else:
+            columns[column] = values.tolist()
+    return {'length': len(table), 'columns': columns}
+
+
+def template_store():
+    return dcc.Store(id=TEMPLATE_STORE, data=pio.templates[pio.templates.default].to_plotly_json(),
+                     storage_type='memory')
+
+
+#callback decorator that leaves the function unregistered, for server callbacks replaced by client side ones
+def unregistered(*args, **kwargs):
+    return lambda func: func
+
+
+#registers dash_clientside.dashboard.<kind>(spec, data, dropdown values, template) for the children of output.
+#spec names the table in the store, the columns the dropdowns filter on (in the order of the dropdowns) and the
+#figure columns
+def clientside_chart(app, store, output, dropdowns, kind, spec):
+    app.clientside_callback(
+        'function(data) {'
+        ' var values = Array.prototype.slice.call(arguments, 1); var template = values.pop();'
+        ' return window.dash_clientside.dashboard.%s(%s, data, values, template); }' % (kind, json.dumps(spec)),
+        Output(output, 'children'),
+        [Input(store, 'data')] + [Input(dropdown, 'value') for dropdown in dropdowns],
+        [State(TEMPLATE_STORE, 'data')])
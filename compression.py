@@ -0,0 +1,58 @@
+import gzip
+
+import flask
+
+from callback_metrics import phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------------------------------------------------
+#response compression
+#the json the dash routes send (callback responses, layout, dependencies) is compressed with brotli when the browser
+#accepts it and the brotli package is installed, with gzip otherwise. small responses are sent as they are. the size
+#before compression is left in flask.g so the callback metrics can report both
+
+PATHS = ('/_dash-update-component', '/_dash-layout', '/_dash-dependencies')
+
+
+class ResponseCompressor:
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=4):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def encoding(self, accept_encoding):
+        accepted = [item.split(';')[0].strip().lower() for item in accept_encoding.split(',')]
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def _after_request(self, response):
+        if (not flask.request.path.endswith(PATHS) or response.direct_passthrough or response.status_code != 200
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = self.encoding(flask.request.headers.get('Accept-Encoding', ''))
+        data = response.get_data()
+        flask.g.uncompressed_bytes = len(data)
+        response.vary.add('Accept-Encoding')
+        if encoding is None or len(data) < self.min_bytes:
+            return response
+        with phase('compress'):
+            response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    #registered after CallbackMetrics.register so it runs before the metrics hook (flask runs them in reverse)
+    def register(self, app):
+        app.server.after_request(self._after_request)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import warnings
+
+import pandas as pd
+
+import settings
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#----------------------------------------------------------------------------------------------------------------------
+#columnar cache of the prepared frames
+#the prepared frame is written as an uncompressed feather (arrow) file with the string columns dictionary encoded.
+#next to it a small json file records the size and mtime of every source file (and a content hash with
+#DATA_CACHE_CHECK_CONTENT), when one of them changes (or the key, a string describing how the frame was derived, e.g.
+#its bucket schemes) the frame is rebuilt from the sources and the cache is rewritten. checking a start costs a stat
+#per source, not a read of the whole file.
+#the numeric and date columns and the codes of the string columns are read zero-copy from the memory mapped file, so
+#with SHARED_DATASET_DIR pointing at shared memory (e.g. /dev/shm/dashboards) every worker process attaches to the
+#same pages. the first worker to start
+#builds the frame under a file lock, the others wait for it and attach
+
+CACHE_DIR = settings.SHARED_DATASET_DIR or settings.DATA_CACHE_DIR
+CHECK_CONTENT = settings.DATA_CACHE_CHECK_CONTENT
+
+
+def file_fingerprint(path, check_content=CHECK_CONTENT):
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if check_content:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint['digest'] = digest.hexdigest()
+    return fingerprint
+
+
+def _paths(name, cache_dir):
+    return os.path.join(cache_dir, name + '.feather'), os.path.join(cache_dir, name + '.json')
+
+
+def _string_columns(frame):
+    return [column for column in frame.columns
+            if frame[column].dtype == object and pd.api.types.infer_dtype(frame[column], skipna=True) == 'string']
+
+
+def write_cache(name, frame, sources, cache_dir=CACHE_DIR, check_content=CHECK_CONTENT, key=None):
+    data_path, meta_path = _paths(name, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    index_name = frame.index.name or 'index'
+    string_columns = _string_columns(frame)
+    table = frame.reset_index()
+    table.columns = [index_name] + list(frame.columns)
+    for column in string_columns:
+        table[column] = table[column].astype('category')
+    meta = {'index': index_name, 'index_name': frame.index.name, 'string_columns': string_columns,
+            'sources': {path: file_fingerprint(path, check_content) for path in sources}, 'key': key}
+    #write under a temporary name first so a half written cache is never picked up
+    feather.write_feather(table, data_path + '.tmp', compression='uncompressed')
+    os.replace(data_path + '.tmp', data_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def read_cache(name, sources, cache_dir=CACHE_DIR, check_content=CHECK_CONTENT, key=None):
+    data_path, meta_path = _paths(name, cache_dir)
+    if feather is None or not os.path.exists(data_path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if sorted(meta['sources']) != sorted(sources) or meta.get('key') != key:
+        return None
+    for path in sources:
+        stored = meta['sources'][path]
+        current = file_fingerprint(path, check_content and 'digest' in stored)
+        if any(stored.get(field) != value for field, value in current.items()):
+            return None
+    try:
+        table = feather.read_table(data_path, memory_map=True)
+    except (OSError, ValueError):
+        return None
+    #split_blocks keeps every column in its own block, so pandas does not consolidate (copy) them. the string
+    #columns stay categoricals built from the arrow dictionaries: their codes are read from the shared file too, only
+    #the small categories are objects of this process
+    frame = table.to_pandas(split_blocks=True)
+    frame.set_index(meta['index'], inplace=True)
+    frame.index.name = meta['index_name']
+    return frame
+
+
+class _BuildLock:
+
+    def __init__(self, name, cache_dir):
+        self.path = os.path.join(cache_dir, name + '.lock')
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.file = open(self.path, 'w')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+
+
+def load_cached(name, sources, build, cache_dir=CACHE_DIR, check_content=CHECK_CONTENT, key=None):
+    sources = list(sources)
+    if feather is None:
+        return build()
+    frame = read_cache(name, sources, cache_dir, check_content, key)
+    if frame is not None:
+        return frame
+    with _BuildLock(name, cache_dir):
+        #another process may have built it while this one waited for the lock
+        frame = read_cache(name, sources, cache_dir, check_content, key)
+        if frame is not None:
+            return frame
+        frame = build()
+        try:
+            write_cache(name, frame, sources, cache_dir, check_content, key)
+        except (OSError, TypeError, ValueError) as error:
+            warnings.warn('could not write the %s cache: %s' % (name, error))
+            return frame
+    #attach to the written file so this process shares the same pages as the others
+    attached = read_cache(name, sources, cache_dir, check_content, key)
+    return frame if attached is None else attached
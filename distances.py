@@ -0,0 +1,84 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+#----------------------------------------------------------------------------------------------------------------------
+#zip to zip distance engine
+#great circle (haversine) miles between zip centroids, from a local table of zip, latitude and longitude. a batch of
+#shipments is one vectorized pass: the zips are looked up in the centroid index, the distinct (origin, destination)
+#pairs are factorized and only pairs not seen before are computed. computed pairs are kept in a compact sorted index
+#(one int64 pair key and one float64 distance per pair), so the few thousand lanes of a history of millions of
+#shipments are computed once. zips missing from the table give nan
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(latitude_1, longitude_1, latitude_2, longitude_2):
+    #all in radians
+    a = (np.sin((latitude_2 - latitude_1) / 2) ** 2
+         + np.cos(latitude_1) * np.cos(latitude_2) * np.sin((longitude_2 - longitude_1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class DistanceEngine:
+
+    #decimals rounds the miles like the export's haversine_distance_miles, max_pairs bounds the pair index
+    def __init__(self, zips, latitudes, longitudes, decimals=2, max_pairs=2000000):
+        self.zips = pd.Index(np.asarray(zips, dtype=np.int64))
+        self.latitudes = np.radians(np.asarray(latitudes, dtype=float))
+        self.longitudes = np.radians(np.asarray(longitudes, dtype=float))
+        self.decimals = decimals
+        self.max_pairs = max_pairs
+        self.pair_keys = np.empty(0, dtype=np.int64)
+        self.pair_miles = np.empty(0)
+        self.computed = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    #csv with a zip column and latitude / longitude (or lat / lng) columns, a zip listed twice keeps its first row
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        table = pd.read_csv(path, low_memory=False)
+        table.columns = [column.strip().lower() for column in table.columns]
+        latitude = 'latitude' if 'latitude' in table else 'lat'
+        longitude = 'longitude' if 'longitude' in table else ('lng' if 'lng' in table else 'lon')
+        table = table.dropna(subset=['zip', latitude, longitude]).drop_duplicates('zip')
+        return cls(table['zip'], table[latitude], table[longitude], **kwargs)
+
+    def stats(self):
+        return {'zips': len(self.zips), 'pairs': len(self.pair_keys), 'computed': self.computed,
+                'reused': self.reused}
+
+    #miles between every origin and destination zip, nan where a zip has no centroid
+    def distances(self, origin_zips, destination_zips):
+        origin = self.zips.get_indexer(pd.to_numeric(np.asarray(origin_zips), errors='coerce'))
+        destination = self.zips.get_indexer(pd.to_numeric(np.asarray(destination_zips), errors='coerce'))
+        known = (origin >= 0) & (destination >= 0)
+        codes, pairs = pd.factorize(origin[known].astype(np.int64) * len(self.zips) + destination[known])
+        miles = np.full(len(origin), np.nan)
+        miles[known] = self._pair_miles(np.asarray(pairs, dtype=np.int64))[codes]
+        return miles
+
+    def _pair_miles(self, pairs):
+        with self._lock:
+            position = np.searchsorted(self.pair_keys, pairs).clip(0, max(len(self.pair_keys) - 1, 0))
+            found = self.pair_keys[position] == pairs if len(self.pair_keys) else np.zeros(len(pairs), dtype=bool)
+            miles = np.empty(len(pairs))
+            miles[found] = self.pair_miles[position[found]]
+            new = pairs[~found]
+            origin, destination = np.divmod(new, len(self.zips))
+            miles[~found] = np.round(haversine_miles(self.latitudes[origin], self.longitudes[origin],
+                                                     self.latitudes[destination], self.longitudes[destination]),
+                                     self.decimals)
+            self.computed += len(new)
+            self.reused += int(found.sum())
+            if len(new):
+                keys = np.concatenate([self.pair_keys, new])
+                values = np.concatenate([self.pair_miles, miles[~found]])
+                if len(keys) > self.max_pairs:
+                    #full, start over with the pairs of this batch
+                    keys, values = pairs, miles
+                order = np.argsort(keys, kind='stable')
+                self.pair_keys, self.pair_miles = keys[order], values[order]
+        return miles
@@ -0,0 +1,136 @@
+import functools
+import threading
+from collections import OrderedDict
+
+import flask
+from plotly.io.json import to_json_plotly
+
+from singleflight import SingleFlight
+
+#----------------------------------------------------------------------------------------------------------------------
+#server side figure cache
+#keeps the output of the build_graph callbacks keyed on the callback, the dataset version and the normalized inputs.
+#bounded by number of entries and by the serialized size of the figures, least recently used entries go first. a
+#figure computed for a request is sized from the response dash serializes for it anyway (see register), only the
+#figures computed outside a request (the cache warmer) are encoded to size them.
+#concurrent requests with identical inputs are coalesced: the first one computes, the others wait for its result
+
+
+def normalize_inputs(args):
+    normalized = []
+    for value in args:
+        if isinstance(value, (list, tuple)):
+            value = tuple(normalize_inputs(value))
+        elif isinstance(value, dict):
+            value = tuple(sorted((key, normalize_inputs([item])[0]) for key, item in value.items()))
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        normalized.append(value)
+    return tuple(normalized)
+
+
+class FigureCache:
+
+    def __init__(self, max_entries=256, max_bytes=128 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, nbytes=None):
+        if nbytes is None and flask.has_request_context():
+            #counted as 0 bytes until the response is sized in _after_request
+            flask.g.setdefault('figure_cache_keys', []).append(key)
+            nbytes = 0
+        elif nbytes is None:
+            nbytes = len(to_json_plotly(value))
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def resize(self, key, nbytes):
+        with self._lock:
+            if key not in self.entries:
+                return
+            value, old_nbytes = self.entries[key]
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes - old_nbytes
+            if nbytes > self.max_bytes:
+                self.nbytes -= self.entries.pop(key)[1]
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+            self.nbytes -= self.entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self.entries), 'bytes': self.nbytes, 'max_entries': self.max_entries,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'coalesced': self._flights.coalesced,
+                    'in_flight': len(self._flights)}
+
+    def _compute(self, key, func, args):
+        #a request that finished just before this one became the leader left its figure in the cache
+        with self._lock:
+            if key in self.entries:
+                return self.entries[key][0]
+        value = func(*args)
+        self.put(key, value)
+        return value
+
+    #decorator for a callback, version returns the current dataset version so new data never serves old figures
+    def memoize(self, version=lambda: 0):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = (func, version(), normalize_inputs(args))
+                found, value = self.get(key)
+                if found:
+                    return value
+                return self._flights.do(key, lambda: self._compute(key, func, args))
+            return wrapper
+        return decorator
+
+    def _after_request(self, response):
+        keys = flask.g.pop('figure_cache_keys', None)
+        if keys:
+            #the size before compression when the response was compressed (see compression.py)
+            nbytes = flask.g.get('uncompressed_bytes', response.calculate_content_length() or 0)
+            for key in keys:
+                self.resize(key, nbytes)
+        return response
+
+    #sizes the figures put during a request from its response. registered after CallbackMetrics.register and before
+    #the ResponseCompressor, so it runs after the compression and before the metrics hook takes the uncompressed size
+    #(flask runs them in reverse)
+    def register(self, app):
+        app.server.after_request(self._after_request)
@@ -0,0 +1,96 @@
+import base64
+import functools
+
+import numpy as np
+from plotly.basedatatypes import BaseFigure
+
+#----------------------------------------------------------------------------------------------------------------------
+#binary figure encoding
+#numeric arrays in the traces of a figure are sent as plotly.js typed arrays ({'dtype': 'f8', 'bdata': <base64>}),
+#11 base64 characters per float64 (less for whole numbers and float32) instead of up to 24 characters of decimal text,
+#and encoding them is a memory copy instead of formatting every number. plotly.js 2.28 and later (dash serves the one
+#of the plotly package) decodes them back to the same numbers, so the charts do not change. short arrays (where the
+#dtype header outweighs the saving) and anything not numeric are left as they are
+
+#smallest typed array dtype that holds the integer range, int64 is not a plotly.js typed array
+INT_DTYPES = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+MIN_LENGTH = 32
+
+
+def typed_array(values):
+    if values.dtype.kind == 'b':
+        return None
+    if values.dtype.kind == 'f' and len(values) and np.isfinite(values).all() and (values == np.round(values)).all():
+        #whole numbers stored as floats (counts, days) are sent as integers
+        values = values.astype(np.int64) if np.abs(values).max() < 2 ** 53 else values
+    if values.dtype.kind in 'iu':
+        if not len(values):
+            return None
+        low, high = values.min(), values.max()
+        for dtype in INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                values = values.astype(dtype)
+                break
+        else:
+            values = values.astype(np.float64)
+    elif values.dtype.kind == 'f':
+        #float32 when that holds every value exactly
+        as_float32 = values.astype(np.float32)
+        values = as_float32 if np.array_equal(as_float32, values, equal_nan=True) else values.astype(np.float64)
+    else:
+        return None
+    encoded = {'dtype': values.dtype.str[1:], 'bdata': base64.b64encode(np.ascontiguousarray(values)).decode('ascii')}
+    if values.ndim > 1:
+        encoded['shape'] = ','.join(str(size) for size in values.shape)
+    return encoded
+
+
+def _numeric(values):
+    if isinstance(values, np.ndarray):
+        return values if values.dtype.kind in 'iuf' else None
+    if isinstance(values, (list, tuple)) and values and all(
+            isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+            for value in values):
+        return np.asarray(values)
+    return None
+
+
+def encode_arrays(value):
+    if isinstance(value, dict):
+        return {key: encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)) and len(value) >= MIN_LENGTH:
+        numeric = _numeric(value)
+        encoded = typed_array(numeric) if numeric is not None else None
+        if encoded is not None:
+            return encoded
+    if isinstance(value, (list, tuple)):
+        return [encode_arrays(item) for item in value]
+    return value
+
+
+#the figure as a dict with the trace arrays typed, the layout (template included) is left as is
+def encode_figure(figure):
+    if isinstance(figure, BaseFigure):
+        figure = figure.to_plotly_json()
+    return dict(figure, data=[encode_arrays(trace) for trace in figure.get('data', [])])
+
+
+def encode_graphs(children):
+    for child in children if isinstance(children, (list, tuple)) else [children]:
+        if getattr(child, 'figure', None) is not None:
+            child.figure = encode_figure(child.figure)
+    return children
+
+
+#callback decorator, the dcc.Graph figures among the returned children are encoded when enabled
+def binary_figures(enabled=True):
+    def decorator(func):
+        if not enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            return encode_graphs(func(*args))
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+import glob
+import os
+import threading
+import traceback
+
+import pandas as pd
+
+#----------------------------------------------------------------------------------------------------------------------
+#file watch ingestion
+#polls a directory for new csv batches (same columns as the source csv) and hands every new file to on_batch once.
+#a file is picked up when its size did not change between two polls, so files still being written are skipped.
+#a batch is marked seen once on_batch succeeded. a failing one (a parse or merge error, on_batch must not leave any
+#part of it applied, see apply_batch) is tried again at the next polls and after max_attempts moved to the failed/
+#subdirectory with its error next to it, so it is not lost and can be fixed and moved back. the set of seen files
+#lives in memory, after a restart every batch in the directory is applied again on top of the source csv
+
+FAILED_DIR = 'failed'
+
+#one batch is committed at a time
+_commit_lock = threading.Lock()
+
+
+#adds a batch to several cubes and stores at once: updates are (target, frame) pairs, every target (a DailyCube,
+#ShipmentStore or PartitionedStore) stages its frame and builds its merged state first, then all the states are
+#swapped in under one lock. a failure before the swap discards what was staged and leaves every target as it was, so
+#the batch can be tried again without counting it twice
+def apply_batch(updates):
+    targets = [target for target, frame in updates]
+    try:
+        for target, frame in updates:
+            target.stage(frame)
+        states = [target.merged() for target in targets]
+    except Exception:
+        for target in targets:
+            target.discard()
+        raise
+    with _commit_lock:
+        for target, state in zip(targets, states):
+            target.commit(state)
+
+
+class BatchWatcher(threading.Thread):
+
+    def __init__(self, directory, on_batch, pattern='*.csv', interval=60, max_attempts=3):
+        super().__init__(daemon=True, name='batch-watcher-' + directory)
+        self.directory = directory
+        self.on_batch = on_batch
+        self.pattern = pattern
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.seen = set()
+        self.failed = 0
+        self._attempts = {}
+        self._sizes = {}
+        self._stopped = threading.Event()
+
+    def poll(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+            if path in self.seen:
+                continue
+            size = os.path.getsize(path)
+            if self._sizes.get(path) != size:
+                self._sizes[path] = size
+                continue
+            try:
+                self.on_batch(pd.read_csv(path, low_memory=False))
+            except Exception:
+                traceback.print_exc()
+                self._attempts[path] = self._attempts.get(path, 0) + 1
+                if self._attempts[path] >= self.max_attempts:
+                    self._set_aside(path, traceback.format_exc())
+                continue
+            self.seen.add(path)
+            self._attempts.pop(path, None)
+
+    def _set_aside(self, path, error):
+        failed_dir = os.path.join(self.directory, FAILED_DIR)
+        os.makedirs(failed_dir, exist_ok=True)
+        target = os.path.join(failed_dir, os.path.basename(path))
+        os.replace(path, target)
+        with open(target + '.error.txt', 'w') as f:
+            f.write(error)
+        self.failed += 1
+        self._attempts.pop(path, None)
+        self._sizes.pop(path, None)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
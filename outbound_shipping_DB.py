@@ -1,50 +1,107 @@
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
 import dash
 from dash import dcc
 from dash import html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 from datetime import datetime as dt
+import settings
+from aggregation import AggregationPlanner, density_bins
+from background import CallbackPool
+from callback_metrics import CallbackMetrics
+from clientside import clientside_chart, encode_columns, template_store, unregistered
+from compression import ResponseCompressor
+from data_cache import load_cached
+from distances import DistanceEngine
+from figure_cache import FigureCache
+from figure_encoding import binary_figures
+from ingest import BatchWatcher, apply_batch
+from partitions import FirstSeen, PartitionedStore
+from query_backend import make_backend
+from sharding import ShardedAggregator
+from shipment_store import ShipmentStore
+from shipping_cube import COUNT, DailyCube
+from shipping_data import BUCKETS, load_shipment_chunks, load_shipments, prepare_shipments
+from warmer import CacheWarmer
 
 #----------------------------------------------------------------------------------------------------------------------
 #data cleaning
 
-df = pd.read_csv(("dummy_data.csv"), low_memory=False)
-
-df['delivery_date'] = pd.to_datetime(df['delivery_date'])
-df['purchase_time'] = pd.to_datetime(df['purchase_time'])
-df["shipment_service"].fillna('Same_day', inplace = True)
-
-#shipping distance and time between order placed and order shipped
-
-df3 = df.copy()
-df3.drop(df3[df3['shipment_service'] == '0'].index, inplace = True)
-
-df3['time_delta'] = ((df3.delivery_date - df3.purchase_time)/np.timedelta64(1, 'D'))
-df3['time_delta'] = df3['time_delta'].apply(np.ceil)
-df3['time_delta'] = pd.Series(df3['time_delta'], dtype="int")
-
-criteria = [df3['time_delta'].between(0,1), df3['time_delta'].between(1,2), df3['time_delta'].between(2,3)
-            , df3['time_delta'].between(3,4), df3['time_delta'].between(4,5), df3['time_delta'].between(5,500)]
-values = ['1', '2', '3', '4','5','6+']
-df3['Date_difference_barchart_v1'] = np.select(criteria, values, 0)
-
-criteria = [df3['haversine_distance_miles'].between(1, 25), df3['haversine_distance_miles'].between(26, 50), df3['haversine_distance_miles'].between(51, 75)
-            , df3['haversine_distance_miles'].between(76, 100), df3['haversine_distance_miles'].between(101, 150), df3['haversine_distance_miles'].between(151, 200)
-            , df3['haversine_distance_miles'].between(201, 250), df3['haversine_distance_miles'].between(251, 5000)]
-values = [25, 50, 75,100,150,200,250 ,500]
-df3['Shipping ranges'] = np.select(criteria, values, 0)
-df3.haversine_distance_miles.round()
-df3['Shipping_distance'] = df3['haversine_distance_miles'] 
-
-#---------------------------------------------------------------------------------------
-
-df3['Shipping_distance'] = pd.Series(df3['Shipping_distance'], dtype="int")
-df5 = df3.copy()
-df5.set_index('delivery_date', inplace=True)
+SHIPMENT_DIMS = ['group', 'transportmode', 'fc', 'product_name', 'recipient_state', 'Date_difference_barchart_v1',
+                 'Shipping ranges']
+#the scatter plots exact distance and day difference, so it gets its own (larger) cube
+SCATTER_DIMS = ['group', 'transportmode', 'Shipping_distance', 'time_delta']
+#dropdown options, in the order the values first appear in the history
+OPTION_COLUMNS = ['product_name', 'fc', 'transportmode']
+
+#missing shipping distances are computed from the zip centroids when a table is configured
+distance_engine = DistanceEngine.from_file(settings.ZIP_CENTROIDS) if settings.ZIP_CENTROIDS else None
+SOURCES = ['dummy_data.csv'] + ([settings.ZIP_CENTROIDS] if settings.ZIP_CENTROIDS else [])
+
+if settings.OUT_OF_CORE:
+    #the csv is streamed in chunks into the cubes below and a date partitioned copy on disk, the raw rows are never
+    #all in memory
+    shipment_store = PartitionedStore(settings.PARTITION_DIR)
+    history = shipment_store.load(SOURCES,
+                                  lambda: load_shipment_chunks('dummy_data.csv', settings.CHUNK_ROWS, distance_engine),
+                                  key=repr(BUCKETS))
+else:
+    #the bucket schemes are part of the cache key, changing an edge rebuilds the cached frame
+    df5 = load_cached('df5', SOURCES, lambda: load_shipments('dummy_data.csv', distance_engine), key=repr(BUCKETS))
+    shipment_store = ShipmentStore(df5)
+    history = [df5]
+
+#large frames and wide date ranges are grouped in date shards on several cores
+aggregator = ShardedAggregator(settings.AGGREGATION_WORKERS, min_rows=settings.SHARD_MIN_ROWS)
+
+#daily cubes built once at load, the callbacks sum cube rows instead of slicing and grouping the shipments. every
+#chunk is aggregated as it streams past and the aggregates are merged once at the end
+shipment_cube = DailyCube(None, SHIPMENT_DIMS, aggregator=aggregator)
+scatter_cube = DailyCube(None, SCATTER_DIMS, aggregator=aggregator)
+options = FirstSeen(OPTION_COLUMNS)
+for chunk in history:
+    shipment_cube.stage(chunk)
+    scatter_cube.stage(chunk)
+    options.add(chunk)
+shipment_cube.commit()
+scatter_cube.commit()
+
+#the charts query the cubes through the QUERY_BACKEND engine
+backend = make_backend(settings.QUERY_BACKEND, aggregator, settings.AGGREGATION_WORKERS)
+backend.register('shipments', shipment_cube).register('scatter', scatter_cube)
+
+#the charts below all listen to the date picker, a date change groups the cube slice once by the union of their keys
+#and each chart rolls that up to its own keys
+date_charts = AggregationPlanner(backend, 'shipments', weight=COUNT)
+date_charts.register('Bar5_v1', ['transportmode'])
+date_charts.register('Bar1', ['group', 'transportmode', 'Date_difference_barchart_v1'])
+date_charts.register('Bar2', ['group', 'transportmode', 'Shipping ranges'])
+date_charts.register('Bar3', ['group', 'transportmode'])
+date_charts.register('Bar4', ['group', 'fc', 'transportmode'])
+date_charts.register('Bar6', ['product_name', 'transportmode'])
+date_charts.register('state_charts', ['fc', 'transportmode', 'product_name', 'recipient_state'])
+
+
+#new shipments (raw rows with the columns of dummy_data.csv) are derived on their own and added to the store and the
+#cubes all at once, the version bump makes the figure cache drop the old figures
+def append_shipments(batch):
+    batch5 = prepare_shipments(batch, distance_engine)
+    apply_batch([(shipment_cube, batch5), (scatter_cube, batch5), (shipment_store, batch5)])
+    cache_warmer.refresh()
+
+
+#figures already built for the same inputs and dataset version are served from memory
+figure_cache = FigureCache(max_entries=settings.FIGURE_CACHE_MAX_ENTRIES,
+                           max_bytes=int(settings.FIGURE_CACHE_MAX_MB * 2 ** 20))
+
+#the heavy callbacks run on a worker pool, a newer request for the same chart from the same browser cancels the
+#stale one
+callback_pool = CallbackPool(max_workers=settings.CALLBACK_WORKERS)
+
+#per phase timings (slice, groupby, figure, serialize), row counts and response sizes of every callback, see /metrics
+metrics = CallbackMetrics(trace_log=settings.CALLBACK_TRACE_LOG or None, slow_seconds=settings.CALLBACK_SLOW_MS / 1000)
 
 # ---------------------------------------------------------------
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
@@ -52,6 +109,9 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
                             'content': 'width=device-width, initial-scale=1.0'}]
                 )
 
+#callbacks of the charts with dropdowns, handled in the browser instead when CLIENTSIDE_FILTERING is set
+server_callback = unregistered if settings.CLIENTSIDE_FILTERING else app.callback
+
 card_3_dropdown = dbc.Card(
                         dbc.CardBody(
                                     [
@@ -59,19 +119,19 @@ card_3_dropdown = dbc.Card(
                                         html.P("Select the product you would like to see in the map and the sunburst.",
                                         className="card-text",),
                                         dcc.Dropdown(id='from_column_dropdown_product', options=[
-                                            {'label': i, 'value': i} for i in df5.product_name.unique()
+                                            {'label': i, 'value': i} for i in options.values('product_name')
                                         ], multi=False, value='Product B'),
                                         html.H4("Select the fulfillment center", className="card-title"),
                                         html.P("Select the fulfillment center you would like to see in the map.",
                                             className="card-text",),
                                         dcc.Dropdown(id='from_column_dropdown_FC', options=[
-                                            {'label': i, 'value': i} for i in df5.fc.unique()
+                                            {'label': i, 'value': i} for i in options.values('fc')
                                         ], multi=False, value='Location B'),
                                         html.H4("Select shipment service", className="card-title"),
                                         html.P("Select the shipping method you would like to see in the map.",
                                             className="card-text",),
                                         dcc.Dropdown(id='from_column_dropdown_shipping', options=[
-                                            {'label': i, 'value': i} for i in df5.transportmode.unique()
+                                            {'label': i, 'value': i} for i in options.values('transportmode')
                                         ], multi=False, value='express')
         
                                     ])
@@ -205,27 +265,29 @@ app.layout = dbc.Container([
      Input(component_id='my-date-picker-range', component_property='end_date')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_5(start_date, end_date):
-    df5_2_1 = df5.loc[start_date:end_date]
-
-    df_barchart5 = df5_2_1.groupby(['transportmode']).size().sort_values(ascending=False).reset_index(name='shipment_sum')
+    df_barchart5 = date_charts.counts('Bar5_v1', start_date, end_date)
     fig_1 = px.bar(df_barchart5, x="transportmode", y="shipment_sum", color="transportmode")
 
     return [dcc.Graph(id='Bar5_v1', figure=fig_1)]
 
 #----------------------------------------------
 #Bar graph 1
-@app.callback(
+@server_callback(
     Output(component_id='Bar1', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='dropdown_plants_flowers', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_1(start_date, end_date, value):
-    df5_2_2 = df5.loc[start_date:end_date]
-    df_barchart1 = df5_2_2.groupby(['group', 'transportmode', 'Date_difference_barchart_v1']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df_barchart1 = date_charts.counts('Bar1', start_date, end_date)
 
     data_build_graph_1 = df_barchart1.copy()[df_barchart1['group'] == value]
 
@@ -235,16 +297,17 @@ def build_graph_1(start_date, end_date, value):
 #----------------------------------------------
 #Bar graph 2
 
-@app.callback(
+@server_callback(
     Output(component_id='Bar2', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='dropdown_plants_flowers', component_property='value')])
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_1(start_date, end_date, value):
-    df5_2_3 = df5.loc[start_date:end_date]
-    df_barchart2 = df5_2_3.groupby(['group', 'transportmode', 'Shipping ranges']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df_barchart2 = date_charts.counts('Bar2', start_date, end_date)
     data_build_graph_1 = df_barchart2.copy()[df_barchart2['group'] == value]
 
     fig_bar_2 = px.bar(data_build_graph_1, x='Shipping ranges', y="shipment_sum", color="transportmode")
@@ -254,19 +317,24 @@ def build_graph_1(start_date, end_date, value):
 #----------------------------------------------
 #Scat graph 1
 
-@app.callback(
+@server_callback(
     Output(component_id='Scat1', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='dropdown_plants_flowers', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_2(start_date, end_date, value):
-    df5_2_4 = df5.loc[start_date:end_date]
-    df_scat_chart_1 = df5_2_4.groupby(['group', 'transportmode', 'Shipping_distance', 'time_delta']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df_scat_chart_1 = backend.counts('scatter', start_date, end_date, SCATTER_DIMS, weight=COUNT)
 
     data_build_graph_2 = df_scat_chart_1.copy()[df_scat_chart_1['group'] == value]
+    #wide date ranges are drawn as density bins instead of one marker per exact distance and day
+    data_build_graph_2 = density_bins(data_build_graph_2, 'Shipping_distance', 'time_delta', 'shipment_sum',
+                                      'transportmode', settings.SCATTER_POINT_BUDGET)
 
     fig_scat_1 = px.scatter(data_build_graph_2, x="Shipping_distance", y="time_delta",
                             size="shipment_sum", color="transportmode",
@@ -277,17 +345,18 @@ def build_graph_2(start_date, end_date, value):
 #----------------------------------------------
 
 #Bar graph 3
-@app.callback(
+@server_callback(
     Output(component_id='Bar3', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='dropdown_plants_flowers', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_3(start_date, end_date, value):
-    df5_2_5 = df5.loc[start_date:end_date]
-    df_barchart3 = df5_2_5.groupby(['group', 'transportmode']).size().sort_values(ascending=False).reset_index(
-        name='shipment_sum')
+    df_barchart3 = date_charts.counts('Bar3', start_date, end_date)
 
     data_build_graph_3 = df_barchart3.copy()[df_barchart3['group'] == value]
 
@@ -297,17 +366,18 @@ def build_graph_3(start_date, end_date, value):
 
 #----------------------------------------------
 #Bar graph 4
-@app.callback(
+@server_callback(
     Output(component_id='Bar4', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='dropdown_plants_flowers', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_4(start_date, end_date, value):
-    df5_2_6 = df5.loc[start_date:end_date]
-    df_barchart4 = df5_2_6.groupby(['group', 'fc', 'transportmode']).size().sort_values(ascending=False).reset_index(
-        name='shipment_sum')
+    df_barchart4 = date_charts.counts('Bar4', start_date, end_date)
 
     data_build_graph_4 = df_barchart4.copy()[df_barchart4['group'] == value]
 
@@ -317,17 +387,18 @@ def build_graph_4(start_date, end_date, value):
 
 #----------------------------------------------
 #Bar graph 6
-@app.callback(
+@server_callback(
     Output(component_id='Bar6', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='from_column_dropdown_product', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_6(start_date, end_date, value):
-    df5_2_7 = df5.loc[start_date:end_date]
-    df_barchart6 = df5_2_7.groupby(['product_name', 'transportmode']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df_barchart6 = date_charts.counts('Bar6', start_date, end_date)
 
     data_build_graph_6 = df_barchart6.copy()[df_barchart6['product_name'] == value]
 
@@ -337,7 +408,7 @@ def build_graph_6(start_date, end_date, value):
 
 # ---------------------------------------------------------------
 
-@app.callback(
+@server_callback(
     Output(component_id='cholro_1', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
@@ -347,10 +418,12 @@ def build_graph_6(start_date, end_date, value):
      ])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_7(start_date, end_date, filter_1, filter_2, filter_3):
-    df4_2_1 = df5.loc[start_date:end_date]
-    df4_3 = df4_2_1.groupby(['fc', 'transportmode', 'product_name', 'recipient_state']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df4_3 = date_charts.counts('state_charts', start_date, end_date)
     df_ch_1 = df4_3[df4_3['product_name'] == filter_1]
     df_ch_2 = df_ch_1[df_ch_1['fc'] == filter_2]
     df_ch_3 = df_ch_2[df_ch_2['transportmode'] == filter_3]
@@ -371,18 +444,22 @@ def build_graph_7(start_date, end_date, filter_1, filter_2, filter_3):
 
 # ---------------------------------------------------------------
 # Connecting the Dropdown values to the graph
-@app.callback(
+@server_callback(
     Output(component_id='sun_1', component_property='children'),
     [Input(component_id='my-date-picker-range', component_property='start_date'),
      Input(component_id='my-date-picker-range', component_property='end_date'),
      Input(component_id='from_column_dropdown_product', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: shipment_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_8(start_date, end_date, filter_1):
-    df4_2_2 = df5.loc[start_date:end_date]
-    df4_3 = df4_2_2.groupby(['fc', 'transportmode', 'product_name', 'recipient_state']).size().sort_values(
-        ascending=False).reset_index(name='shipment_sum')
+    df4_3 = date_charts.counts('state_charts', start_date, end_date)
     df_ch_1 = df4_3[df4_3['product_name'] == filter_1]
+    #px groups categoricals with every combination of their categories, the path gets the plain values
+    df_ch_1 = df_ch_1.astype({column: object for column in ['recipient_state', 'fc', 'transportmode']})
 
     fig = px.sunburst(df_ch_1, path=['recipient_state','fc', 'transportmode'], values='shipment_sum', color='transportmode',width=1200,
                   height=1200)
@@ -390,6 +467,94 @@ def build_graph_8(start_date, end_date, filter_1):
     return [dcc.Graph(id='Sun_1', figure=fig)]
 
 
+#------------------------------------------------
+#client side filtering: a date range change fills store_data_fedex_analysis with the pre-aggregated tables of every
+#chart with a dropdown, the dropdowns then only filter those tables in the browser (assets/clientside_filters.js)
+
+CLIENTSIDE_TABLES = ['Bar1', 'Bar2', 'Bar3', 'Bar4', 'Bar6', 'state_charts']
+
+if settings.CLIENTSIDE_FILTERING:
+    app.layout.children.append(template_store())
+
+    @app.callback(
+        Output(component_id='store_data_fedex_analysis', component_property='data'),
+        [Input(component_id='my-date-picker-range', component_property='start_date'),
+         Input(component_id='my-date-picker-range', component_property='end_date')])
+    @metrics.instrument
+    @figure_cache.memoize(version=lambda: shipment_store.version)
+    def build_store_data(start_date, end_date):
+        data = {chart: encode_columns(date_charts.counts(chart, start_date, end_date)) for chart in CLIENTSIDE_TABLES}
+        #the scatter is binned per group, the budget holds for whichever group is picked
+        scatter = backend.counts('scatter', start_date, end_date, SCATTER_DIMS, weight=COUNT)
+        scatter = [density_bins(points, 'Shipping_distance', 'time_delta', 'shipment_sum', 'transportmode',
+                                settings.SCATTER_POINT_BUDGET).assign(group=group)
+                   for group, points in scatter.groupby('group', observed=True, sort=False)]
+        data['Scat1'] = encode_columns(pd.concat(scatter, ignore_index=True) if scatter else
+                                       pd.DataFrame(columns=['transportmode', 'Shipping_distance', 'time_delta',
+                                                             'shipment_sum', 'group']))
+        return data
+
+    store = 'store_data_fedex_analysis'
+    groups = ['dropdown_plants_flowers']
+    products = ['from_column_dropdown_product']
+    for output, x, color in [('Bar1', 'Date_difference_barchart_v1', 'transportmode'),
+                             ('Bar2', 'Shipping ranges', 'transportmode'),
+                             ('Bar3', 'transportmode', 'transportmode'),
+                             ('Bar4', 'transportmode', 'fc')]:
+        clientside_chart(app, store, output, groups, 'bar', {'table': output, 'filters': ['group'], 'x': x,
+                                                             'y': 'shipment_sum', 'color': color,
+                                                             'graph': output + '_v1'})
+    clientside_chart(app, store, 'Bar6', products, 'bar', {'table': 'Bar6', 'filters': ['product_name'],
+                                                           'x': 'transportmode', 'y': 'shipment_sum',
+                                                           'color': 'product_name', 'graph': 'Bar6_v1'})
+    clientside_chart(app, store, 'Scat1', groups, 'scatter', {'table': 'Scat1', 'filters': ['group'],
+                                                              'x': 'Shipping_distance', 'y': 'time_delta',
+                                                              'size': 'shipment_sum', 'color': 'transportmode',
+                                                              'size_max': 60, 'log_x': True, 'graph': 'Scat1_v1'})
+    clientside_chart(app, store, 'cholro_1', products + ['from_column_dropdown_FC', 'from_column_dropdown_shipping'],
+                     'choropleth', {'table': 'state_charts', 'filters': ['product_name', 'fc', 'transportmode'],
+                                    'locations': 'recipient_state', 'z': 'shipment_sum',
+                                    'title': 'Total Fedex Shipments per State', 'graph': 'Chloro_graph_1'})
+    clientside_chart(app, store, 'sun_1', products, 'sunburst', {'table': 'state_charts', 'filters': ['product_name'],
+                                                                 'path': ['recipient_state', 'fc', 'transportmode'],
+                                                                 'values': 'shipment_sum', 'color': 'transportmode',
+                                                                 'width': 1200, 'height': 1200, 'graph': 'Sun_1'})
+
+
+#------------------------------------------------
+#hit, miss and eviction counters of the figure cache
+@app.server.route('/figure-cache')
+def figure_cache_stats():
+    return figure_cache.stats()
+
+
+#callback latency histograms per output and phase in the prometheus text format at /metrics
+metrics.gauges['dash_figure_cache'] = figure_cache.stats
+metrics.gauges['dash_callback_pool'] = callback_pool.stats
+metrics.gauges['dash_sharded_aggregation'] = aggregator.stats
+if distance_engine is not None:
+    metrics.gauges['dash_distance_engine'] = distance_engine.stats
+callback_pool.register(app)
+
+#the default and most requested views are computed in the background after startup and after every data refresh,
+#/health reports when that is done
+cache_warmer = CacheWarmer(app, version=lambda: shipment_store.version, top=settings.WARM_TOP_VIEWS,
+                           interval=settings.WARM_CHECK_SECONDS)
+cache_warmer.register(app)
+if settings.CACHE_WARMER:
+    cache_warmer.start()
+#the batch watcher starts last, its batches refresh the figure cache and the warmer built above
+if settings.SHIPMENT_INGEST_DIR:
+    BatchWatcher(settings.SHIPMENT_INGEST_DIR, append_shipments, interval=settings.INGEST_INTERVAL_SECONDS).start()
+metrics.register(app)
+#sizes the cached figures from their responses, between the metrics and the compression hooks
+figure_cache.register(app)
+
+#compressed responses, registered after the metrics so the metrics see the size before and after
+if settings.COMPRESS_RESPONSES:
+    ResponseCompressor(min_bytes=settings.COMPRESS_MIN_BYTES).register(app)
+
+
 #------------------------------------------------
 #launching the app
 
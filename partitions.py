@@ -0,0 +1,223 @@
+import glob
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from callback_metrics import phase
+from data_cache import file_fingerprint
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+#----------------------------------------------------------------------------------------------------------------------
+#out-of-core shipment history
+#the source is read in chunks, every chunk is prepared on its own and written to a directory per month of its date
+#index (<directory>/2022-11/000012.feather). the dashboard keeps only the aggregates it builds from the chunks as they
+#stream past, so memory is bounded by the chunk size and the aggregates instead of the length of the history, and
+#the rare raw-row lookups read the months of their date range back from disk.
+#a manifest records the fingerprints of the sources and the key (how the rows were derived), the next start streams
+#the written partitions instead of parsing and deriving the source again. stale partitions are removed file by file
+#(only what the store wrote), a non-empty directory without a manifest is refused. appended batches are written as
+#batch files, they are dropped at the next start because the batch watcher applies its directory again on top of the
+#source
+
+MANIFEST = 'manifest.json'
+
+
+class PartitionedStore:
+
+    def __init__(self, directory, max_slices=4):
+        if feather is None:
+            raise ImportError('the out-of-core shipment store needs pyarrow')
+        self.directory = directory
+        self.max_slices = max_slices
+        self.version = 0
+        self.parts = 0
+        #no rows with the columns and dtypes of the history, the slice of a range without partitions
+        self.empty = None
+        self.staged = []
+        self._slices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _part_paths(self, prefix=''):
+        paths = glob.glob(os.path.join(self.directory, '*', prefix + '*.feather'))
+        #chunk order first, the months of one chunk after another
+        return sorted(paths, key=lambda path: (os.path.basename(path), path))
+
+    #prepared chunks of the sources, chunks() is only called when the partitions are missing or stale. the chunks are
+    #yielded as they are written, the manifest is marked complete once all of them are, so an interrupted load starts
+    #over
+    def load(self, sources, chunks, key=None):
+        manifest = {'sources': {path: file_fingerprint(path) for path in sources}, 'key': key, 'complete': True}
+        if self._manifest() == manifest:
+            #committed and staged batch files
+            for path in glob.glob(os.path.join(self.directory, '*', 'batch-*')):
+                os.remove(path)
+            for path in self._part_paths():
+                self.parts += 1
+                part = feather.read_feather(path)
+                part = part.set_index(part.columns[0])
+                self.empty = part.iloc[:0] if self.empty is None else self.empty
+                yield part
+            return
+        self._clear()
+        self._write_manifest(dict(manifest, complete=False))
+        for chunk in chunks():
+            self.write(chunk)
+            yield chunk
+        self._write_manifest(manifest)
+
+    def _write_manifest(self, manifest):
+        with open(os.path.join(self.directory, MANIFEST + '.tmp'), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(self.directory, MANIFEST + '.tmp'), os.path.join(self.directory, MANIFEST))
+
+    #removes the partitions and the manifest this store wrote and nothing else. a directory with other content and
+    #no manifest is not one of ours, it is refused instead of emptied
+    def _clear(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._manifest() is None and os.listdir(self.directory):
+            raise ValueError('%s is not empty and holds no partition manifest, refusing to use it for the partitions'
+                             % self.directory)
+        for month_dir in glob.glob(os.path.join(self.directory, '*-*')):
+            if not re.fullmatch(r'\d{4}-\d{2}', os.path.basename(month_dir)) or not os.path.isdir(month_dir):
+                continue
+            for path in glob.glob(os.path.join(month_dir, '*.feather')) + glob.glob(os.path.join(month_dir, '*.tmp')):
+                os.remove(path)
+            if not os.listdir(month_dir):
+                os.rmdir(month_dir)
+        for name in (MANIFEST, MANIFEST + '.tmp'):
+            if os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+
+    #the paths written, a chunk that fails half way leaves none of its files behind
+    def write(self, chunk, prefix='', suffix=''):
+        name = '%s%06d.feather%s' % (prefix, self.parts, suffix)
+        self.parts += 1
+        self.empty = chunk.iloc[:0] if self.empty is None else self.empty
+        months = chunk.index.to_period('M')
+        paths = []
+        try:
+            for month in months.unique():
+                month_dir = os.path.join(self.directory, str(month))
+                os.makedirs(month_dir, exist_ok=True)
+                paths.append(os.path.join(month_dir, name))
+                feather.write_feather(chunk[months == month].reset_index(), paths[-1], compression='uncompressed')
+        except Exception:
+            self._remove(paths)
+            raise
+        return paths
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+            if os.path.isdir(os.path.dirname(path)) and not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))
+
+    #a batch is written under temporary names that slices do not read, commit() renames the files into place and
+    #discard() removes them (see ingest.apply_batch)
+    def stage(self, batch):
+        self.staged += self.write(batch, prefix='batch-', suffix='.tmp')
+
+    def merged(self):
+        return list(self.staged)
+
+    def commit(self, paths=None):
+        paths = self.merged() if paths is None else paths
+        with self._lock:
+            for path in paths:
+                os.replace(path, path[:-len('.tmp')])
+            self.staged = []
+            self.version += 1
+            self._slices.clear()
+
+    def discard(self):
+        self._remove(self.staged)
+        self.staged = []
+
+    def append(self, batch):
+        self.stage(batch)
+        self.commit()
+
+    def _months(self, start_date, end_date):
+        first = pd.Timestamp(start_date).to_period('M') if start_date else None
+        last = pd.Timestamp(end_date).to_period('M') if end_date else None
+        for month_dir in sorted(glob.glob(os.path.join(self.directory, '*-*'))):
+            month = pd.Period(os.path.basename(month_dir), 'M')
+            if (first is None or month >= first) and (last is None or month <= last):
+                yield month_dir
+
+    def _read_months(self, month_dirs):
+        pieces = [feather.read_feather(path) for month_dir in month_dirs
+                  for path in sorted(glob.glob(os.path.join(month_dir, '*.feather')))]
+        if not pieces:
+            return self.empty
+        #the chunks were categorized on their own, concat gives objects where the categories differ
+        categories = [column for column in pieces[0].columns if pieces[0][column].dtype == 'category']
+        frame = pd.concat(pieces, ignore_index=True)
+        for column in categories:
+            frame[column] = frame[column].astype('category')
+        frame.set_index(frame.columns[0], inplace=True)
+        return frame.sort_index(kind='mergesort')
+
+    #same rows as ShipmentStore.slice, read from the months the range covers
+    def slice(self, start_date, end_date):
+        with self._lock:
+            key = (self.version, start_date, end_date)
+            if key in self._slices:
+                self._slices.move_to_end(key)
+                return self._slices[key]
+        with phase('slice') as timed:
+            frame = self._read_months(self._months(start_date, end_date))
+            frame_slice = frame.iloc[frame.index.slice_indexer(start_date, end_date)]
+            timed.rows = len(frame_slice)
+        with self._lock:
+            self._slices[key] = frame_slice
+            while len(self._slices) > self.max_slices:
+                self._slices.popitem(last=False)
+        return frame_slice
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#distinct values of columns in the order they first appear in the date sorted history (what frame[column].unique()
+#gives on the whole sorted frame), collected from prepared chunks in source order
+
+
+class FirstSeen:
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.first = {column: {} for column in self.columns}
+        self.chunks = 0
+
+    def add(self, chunk):
+        for column in self.columns:
+            values = chunk[column]
+            positions = np.flatnonzero(~values.duplicated().to_numpy())
+            seen = self.first[column]
+            for position in positions:
+                value = values.iat[position]
+                order = (chunk.index[position], self.chunks, position)
+                if value not in seen or order < seen[value]:
+                    seen[value] = order
+        self.chunks += 1
+
+    def values(self, column):
+        seen = self.first[column]
+        return sorted(seen, key=seen.get)
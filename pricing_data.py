@@ -0,0 +1,40 @@
+import pandas as pd
+import numpy as np
+
+from rate_cards import RateCardIndex
+
+#----------------------------------------------------------------------------------------------------------------------
+#data cleaning and vendor pricing for the pricing dashboard
+
+
+VENDOR_FILES = ['vendor_A_data.csv', 'vendor_B_data.csv']
+
+
+def overspend(df_overspend):
+    df_overspend['optimal_price'] = np.where((df_overspend['shipping_price'] <= df_overspend['lowest_price_available']),
+                                   df_overspend['shipping_price'], df_overspend['lowest_price_available'])
+    return df_overspend
+
+
+def prepare_pricing(df, rate_cards):
+    #every vendor's price for the shipment lane, the lowest one and the vendor that should have shipped
+    prices = rate_cards.lookup(df['sending_zip_code'], df['delivery_zipcode'])
+    for vendor, column in enumerate(rate_cards.columns):
+        df[column] = prices[:, vendor]
+    df['lowest_price_available'], df['optimal_vendor'] = rate_cards.best(prices, df['shipping_price'])
+
+    pricing_df = overspend(df)
+
+    pricing_df['pricing_difference'] = pricing_df['shipping_price'] - pricing_df['optimal_price']
+
+    pricing_df['purchase_time_index'] = pd.to_datetime(pricing_df['purchase_time_index'])
+    pricing_df['purchase_time_index_index'] = pricing_df.purchase_time_index.copy()
+    pricing_df.set_index('purchase_time_index_index', inplace=True)
+    #stored sorted so the shipment store can use it without another sorted copy
+    pricing_df.sort_index(kind='mergesort', inplace=True)
+    return pricing_df
+
+
+def load_pricing(path="check_zipcode_2_data.csv", vendor_paths=VENDOR_FILES):
+    df = pd.read_csv(path, low_memory=False)
+    return prepare_pricing(df, RateCardIndex.from_files(vendor_paths))
@@ -1,68 +1,115 @@
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
 import dash
 from dash import dcc
 from dash import html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 from datetime import datetime as dt
+import threading
+import settings
+from background import CallbackPool
+from callback_metrics import CallbackMetrics
+from compression import ResponseCompressor
+from data_cache import load_cached
+from distances import DistanceEngine
+from figure_cache import FigureCache
+from figure_encoding import binary_figures
+from ingest import BatchWatcher, apply_batch
+from pricing_data import VENDOR_FILES, prepare_pricing
+from pricing_simulator import PricingSimulator
+from query_backend import make_backend
+from rate_cards import RateCardIndex
+from sharding import ShardedAggregator
+from shipment_store import ShipmentStore
+from shipping_cube import COUNT, DailyCube
+from shipping_data import BUCKETS
+from warmer import CacheWarmer
 
 
 #----------------------------------------------------------------------------------------------------------------------
 #data cleaning
 
-df = pd.read_csv(("check_zipcode_2_data.csv"), low_memory=False)
-df_vendor_A = pd.read_csv(("vendor_A_data.csv"), low_memory=False)
-df_vendor_B = pd.read_csv(("vendor_B_data.csv"), low_memory=False)
-
-#----------------------------------------------------------------------------------------------------------------------
-#joining
-df_merge_A = pd.merge(df, df_vendor_A,  how='left', left_on=['sending_zip_code','delivery_zipcode'],
-         right_on = ['sending_zip','receiving_zip'])
-df_merge_AB = pd.merge(df_merge_A, df_vendor_B,  how='left', left_on=['sending_zip_code','delivery_zipcode'],
-         right_on = ['sending_zip','receiving_zip'])
-df_merge_AB = df_merge_AB.drop('Unnamed: 4', axis=1)
-df_merge_AB = df_merge_AB.rename(columns={'vendor_x': 'vendor_A', 'sending_zip_x': 'sending_zip_vendor_A',
-                                          'receiving_zip_x': 'receiving_zip_vendor_A',
-                                          'vendor_A_pricing': 'vendor_A_pricing',
-                                          'vendor_y': 'vendor_B', 'sending_zip_y': 'sending_zip_vendor_B',
-                                          'receiving_zip_y': 'receiving_zip_vendor_B',
-                                          'vendor_B_pricing': 'vendor_B_pricing'})
-df_merge_AB['lowest_price_available'] = df_merge_AB[['vendor_A_pricing','vendor_B_pricing']].min(axis=1)
-
-def should_have_shipped_from_vendor(df_should):
-
-    conditions = [
-        (df_should['vendor_A_pricing'] < df_should['shipping_price']) &
-        (df_should['vendor_A_pricing'] < df_should['vendor_B_pricing']),
-        (df_should['vendor_B_pricing'] < df_should['shipping_price']) &
-        (df_should['vendor_B_pricing'] < df_should['vendor_A_pricing']),
-        (df_should['shipping_price'] <= df_should['vendor_B_pricing']) &
-        (df_should['shipping_price'] <= df_should['vendor_A_pricing'])
-    ]
-    values = ['Vendor A', 'Vendor B', 'Vendor C']
-    df_should['optimal_vendor'] = np.select(conditions, values)
-
-    return df_should
-vendor_should_df = should_have_shipped_from_vendor(df_merge_AB)
-
-def overspend(df_overspend):
-    df_overspend['optimal_price'] = np.where((df_overspend['shipping_price'] <= df_overspend['lowest_price_available']),
-                                   df_overspend['shipping_price'], df_overspend['lowest_price_available'])
-    return df_overspend
-pricing_df = overspend(vendor_should_df)
-
-pricing_df['pricing_difference'] = pricing_df['shipping_price'] - pricing_df['optimal_price']
-
-pricing_df_2 = pricing_df.copy()
-pricing_df_2['purchase_time_index'] = pd.to_datetime(pricing_df_2['purchase_time_index'])
-pricing_df_2['purchase_time_index_index'] = pricing_df_2.purchase_time_index.copy()
-pricing_df_2.set_index('purchase_time_index_index', inplace=True)
+rate_cards = RateCardIndex.from_files(VENDOR_FILES)
+PRICING_SOURCES = ['check_zipcode_2_data.csv'] + VENDOR_FILES
+#lanes a vendor does not price get its median price for the origin and shipping range, from the zip centroids
+distance_engine = None
+if settings.RATE_FALLBACK and settings.ZIP_CENTROIDS:
+    distance_engine = DistanceEngine.from_file(settings.ZIP_CENTROIDS)
+    rate_cards.distance_fallback(distance_engine, BUCKETS['Shipping ranges'][1])
+    PRICING_SOURCES.append(settings.ZIP_CENTROIDS)
+pricing_df_2 = load_cached('pricing_df_2', PRICING_SOURCES,
+                           lambda: prepare_pricing(pd.read_csv("check_zipcode_2_data.csv", low_memory=False),
+                                                   rate_cards),
+                           key=None if distance_engine is None else 'rate fallback ' + repr(BUCKETS['Shipping ranges']))
+
+#sorted once, the callbacks take their date range slices from here
+pricing_store = ShipmentStore(pricing_df_2)
+#wide date ranges are grouped in date shards on several cores
+aggregator = ShardedAggregator(settings.AGGREGATION_WORKERS, min_rows=settings.SHARD_MIN_ROWS)
+
+#daily rollups of the measures the sunburst, the average cost scatter and the choropleth plot, built once at load:
+#vendor -> fc zip -> state -> product, and fc zip x state
+SUNBURST_PATH = ['optimal_vendor', 'sending_zip_code', 'state', 'product']
+
+
+#the sunburst shows the groups with rows whose pricing_difference is not 0 (unpriced lanes, NaN, included),
+#counted per rollup row in overspend_rows
+def vendor_rows(frame):
+    rows = frame[SUNBURST_PATH + ['shipping_price', 'pricing_difference']]
+    return rows.assign(overspend_rows=(rows['pricing_difference'] != 0).astype('int64'))
+
+
+vendor_cube = DailyCube(vendor_rows(pricing_df_2), SUNBURST_PATH,
+                        ['shipping_price', 'pricing_difference', 'overspend_rows'], aggregator=aggregator)
+zip_state_cube = DailyCube(pricing_df_2, ['sending_zip_code', 'state_abbr'], ['pricing_difference'],
+                           aggregator=aggregator)
+
+#the charts query the store and the rollups through the QUERY_BACKEND engine
+backend = make_backend(settings.QUERY_BACKEND, aggregator, settings.AGGREGATION_WORKERS)
+backend.register('pricing', pricing_store).register('vendor_rollup', vendor_cube)
+backend.register('zip_state_rollup', zip_state_cube)
+
+
+#new shipments (raw rows with the columns of check_zipcode_2_data.csv) are priced on their own and added to the
+#rollups and the store all at once, the version bump makes the figure cache drop the old figures
+def append_pricing(batch):
+    priced = prepare_pricing(batch, rate_cards)
+    apply_batch([(vendor_cube, vendor_rows(priced)), (zip_state_cube, priced), (pricing_store, priced)])
+    cache_warmer.refresh()
+
+
+#what-if pricing of candidate rate cards and routing rules (pricing_simulator.Scenario) over the whole history,
+#e.g. simulate([Scenario('A -5%', rate_cards, scale={'Vendor A': 0.95}), ...]). the simulator factorizes the history
+#on first use and again after batches were added
+_simulator = {}
+_simulator_lock = threading.Lock()
+
+
+def simulate(scenarios):
+    with _simulator_lock:
+        if _simulator.get('version') != pricing_store.version:
+            if _simulator.get('simulator') is not None and _simulator['simulator'].executor is not None:
+                _simulator['simulator'].executor.shutdown(wait=False)
+            _simulator['simulator'] = PricingSimulator(pricing_store.frame, workers=settings.AGGREGATION_WORKERS)
+            _simulator['version'] = pricing_store.version
+        simulator = _simulator['simulator']
+    return simulator.run(scenarios)
 
 #pricing_df_2.to_csv('out.csv')
 
+#figures already built for the same inputs and dataset version are served from memory
+figure_cache = FigureCache(max_entries=settings.FIGURE_CACHE_MAX_ENTRIES,
+                           max_bytes=int(settings.FIGURE_CACHE_MAX_MB * 2 ** 20))
+
+#the heavy callbacks run on a worker pool, a newer request for the same chart from the same browser cancels the
+#stale one
+callback_pool = CallbackPool(max_workers=settings.CALLBACK_WORKERS)
+
+#per phase timings (slice, groupby, figure, serialize), row counts and response sizes of every callback, see /metrics
+metrics = CallbackMetrics(trace_log=settings.CALLBACK_TRACE_LOG or None, slow_seconds=settings.CALLBACK_SLOW_MS / 1000)
+
 #----------------------------------------------------------------------------------------------------------------------
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
                 meta_tags=[{'name': 'viewport',
@@ -176,10 +223,12 @@ app.layout = dbc.Container([
      Input(component_id='date_picker', component_property='end_date')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: pricing_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_1(start_date, end_date):
-    df_bar_1 = pricing_df_2.sort_index().loc[start_date:end_date]
-    df_barchart1 = df_bar_1.groupby(['product','state']).size().sort_values(ascending=False).reset_index(
-        name='shipment_sum')
+    df_barchart1 = backend.counts('pricing', start_date, end_date, ['product', 'state'])
     fig_1 = px.bar(df_barchart1, x="product", y="shipment_sum", color="state")
     return [dcc.Graph(id='Bar1_v1', figure=fig_1)]
 
@@ -191,11 +240,12 @@ def build_graph_1(start_date, end_date):
      Input(component_id='from_column_dropdown_state', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: pricing_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_2(start_date, end_date, state):
-    df_bar_2 = pricing_df_2.sort_index().loc[start_date:end_date]
-    df_bar_3 = df_bar_2[df_bar_2['state'] == state]
-    df_barchart2 = df_bar_3.groupby(['product', 'county']).size().sort_values(ascending=False).reset_index(
-        name='shipment_sum')
+    df_barchart2 = backend.counts('pricing', start_date, end_date, ['product', 'county'], filters={'state': state})
     fig_1 = px.bar(df_barchart2, x="product", y="shipment_sum", color="county")
     return [dcc.Graph(id='Bar2_v1', figure=fig_1)]
 
@@ -206,12 +256,13 @@ def build_graph_2(start_date, end_date, state):
      Input(component_id='date_picker', component_property='end_date')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: pricing_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_3(start_date, end_date):
-    df_bar_3 = pricing_df_2.sort_index().loc[start_date:end_date]
-    df_bar_3 = df_bar_3.drop('purchase_time_index', axis=1)
-    df_bar_3['shipment_count'] = 1
-    df_barchart3 = df_bar_3.groupby(['product','state']).sum().reset_index()
-    df_barchart3['average shipment cost'] = df_barchart3['shipping_price'] / df_barchart3['shipment_count']
+    df_barchart3 = backend.group('vendor_rollup', start_date, end_date, ['product', 'state'], ['shipping_price', COUNT])
+    df_barchart3['average shipment cost'] = df_barchart3['shipping_price'] / df_barchart3[COUNT]
     fig_1 = px.scatter(df_barchart3,x="state", y="average shipment cost", size="average shipment cost", color="product")
     return [dcc.Graph(id='scatter3_v1', figure=fig_1)]
 
@@ -223,11 +274,13 @@ def build_graph_3(start_date, end_date):
      Input(component_id='from_column_dropdown_zip', component_property='value')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: pricing_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_4(start_date, end_date, fc_zip):
-    df_bar_2 = pricing_df_2.sort_index().loc[start_date:end_date]
-    df_bar_3 = df_bar_2[df_bar_2['sending_zip_code'] == fc_zip]
-    df_bar_3 = df_bar_3.drop('purchase_time_index', axis=1)
-    df_barchart3 = df_bar_3.groupby(['state_abbr']).sum().reset_index()
+    df_barchart3 = backend.group('zip_state_rollup', start_date, end_date, ['state_abbr'], ['pricing_difference'],
+                                 filters={'sending_zip_code': fc_zip})
     fig = go.Figure(data=go.Choropleth(
         locations=df_barchart3['state_abbr'],  # Spatial coordinates
         z=df_barchart3['pricing_difference'].astype(float),  # Data to be color-coded
@@ -248,17 +301,56 @@ def build_graph_4(start_date, end_date, fc_zip):
      Input(component_id='date_picker', component_property='end_date')])
 
 
+@metrics.instrument
+@figure_cache.memoize(version=lambda: pricing_store.version)
+@callback_pool.superseding
+@binary_figures(settings.BINARY_FIGURES)
 def build_graph_8(start_date, end_date):
-    df_sun_1 = pricing_df_2.sort_index().loc[start_date:end_date]
-    df_sun_1 = df_sun_1.drop('purchase_time_index', axis=1)
-    df_sun_1 = df_sun_1[df_sun_1['pricing_difference'] != 0]
-    df_sun_2 = df_sun_1.groupby(['optimal_vendor','sending_zip_code', 'state', 'product']).sum().reset_index()
-    fig = px.sunburst(df_sun_2, path=['optimal_vendor','sending_zip_code','state', 'product'], values='pricing_difference',
+    df_sun_2 = backend.group('vendor_rollup', start_date, end_date, SUNBURST_PATH,
+                             ['pricing_difference', 'overspend_rows'])
+    df_sun_2 = df_sun_2[df_sun_2['overspend_rows'] > 0]
+    #px groups categoricals with every combination of their categories, the path gets the plain values
+    df_sun_2 = df_sun_2.astype({column: object for column in SUNBURST_PATH})
+    fig = px.sunburst(df_sun_2, path=SUNBURST_PATH, values='pricing_difference',
                       color='pricing_difference',width=1200,height=1200)
 
     return [dcc.Graph(id='sun_5_v1', figure=fig)]
 
 
+#----------------------------------------------------------------------------------------------------------------------
+#hit, miss and eviction counters of the figure cache
+@app.server.route('/figure-cache')
+def figure_cache_stats():
+    return figure_cache.stats()
+
+
+#callback latency histograms per output and phase in the prometheus text format at /metrics
+metrics.gauges['dash_figure_cache'] = figure_cache.stats
+metrics.gauges['dash_callback_pool'] = callback_pool.stats
+metrics.gauges['dash_sharded_aggregation'] = aggregator.stats
+if distance_engine is not None:
+    metrics.gauges['dash_distance_engine'] = distance_engine.stats
+callback_pool.register(app)
+
+#the default and most requested views are computed in the background after startup and after every data refresh,
+#/health reports when that is done
+cache_warmer = CacheWarmer(app, version=lambda: pricing_store.version, top=settings.WARM_TOP_VIEWS,
+                           interval=settings.WARM_CHECK_SECONDS)
+cache_warmer.register(app)
+if settings.CACHE_WARMER:
+    cache_warmer.start()
+#the batch watcher starts last, its batches refresh the figure cache and the warmer built above
+if settings.PRICING_INGEST_DIR:
+    BatchWatcher(settings.PRICING_INGEST_DIR, append_pricing, interval=settings.INGEST_INTERVAL_SECONDS).start()
+metrics.register(app)
+#sizes the cached figures from their responses, between the metrics and the compression hooks
+figure_cache.register(app)
+
+#compressed responses, registered after the metrics so the metrics see the size before and after
+if settings.COMPRESS_RESPONSES:
+    ResponseCompressor(min_bytes=settings.COMPRESS_MIN_BYTES).register(app)
+
+
 #----------------------------------------------------------------------------------------------------------------------
 #launching the app
 
@@ -0,0 +1,161 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#----------------------------------------------------------------------------------------------------------------------
+#batch what-if pricing simulator
+#prices the shipment history under candidate rate cards and routing rules: every shipment moves to the vendor its
+#scenario routes it to, or stays with the incumbent at the price paid. the history is factorized once into lanes
+#(fc zip, delivery zip) and slices (fc zip, state), with the prices paid on every lane sorted and summed up. a scenario
+#looks up its rate cards for the few thousand lanes only, and per lane the shipments that switch are the ones that
+#paid above a threshold: one binary search per lane instead of a pass over the shipments, so the time of a scenario
+#does not grow with the length of the history. scenarios are evaluated in a thread pool. with the loaded
+#vendor files and no rules the savings add up to the pricing_difference of the dashboard (what the shipments
+#overspent)
+
+SLICE = ['sending_zip_code', 'state']
+RESULT_COLUMNS = ['scenario'] + SLICE + ['vendor', 'shipments', 'spend', 'baseline', 'savings', 'share']
+
+
+class Scenario:
+
+    #rate_cards is a RateCardIndex of the candidate vendors. routing rules: scale multiplies the prices of a vendor
+    #(e.g. {'Vendor A': 0.95} for a 5% discount), vendors restricts the vendors shipments may move to, min_savings is
+    #the least saving per shipment worth a switch, assign sends every shipment of an fc zip to one vendor (e.g.
+    #{22001: 'Vendor B'}) wherever that vendor prices the lane, cheaper or not
+    def __init__(self, name, rate_cards, scale=None, vendors=None, min_savings=0.0, assign=None):
+        self.name = name
+        self.rate_cards = rate_cards
+        self.scale = dict(scale or {})
+        self.vendors = list(rate_cards.labels if vendors is None else vendors)
+        self.min_savings = min_savings
+        self.assign = dict(assign or {})
+        unknown = (set(self.scale) | set(self.vendors) | set(self.assign.values())) - set(rate_cards.labels)
+        if unknown:
+            raise ValueError('scenario %r names vendors without a rate card: %s' % (name, ', '.join(sorted(unknown))))
+
+    def __repr__(self):
+        return 'Scenario(%r, vendors=%r)' % (self.name, self.vendors)
+
+
+class PricingSimulator:
+
+    #shipments has the sending_zip_code, delivery_zipcode, state and shipping_price columns of the pricing data,
+    #workers None evaluates scenarios on every core, 0 or 1 in the calling thread
+    def __init__(self, shipments, workers=None, incumbent='Vendor C'):
+        origin, origins = pd.factorize(shipments['sending_zip_code'])
+        destination, destinations = pd.factorize(shipments['delivery_zipcode'])
+        lane, lanes = pd.factorize(origin.astype(np.int64) * len(destinations) + destination)
+        self.lane_origins = np.asarray(origins)[lanes // len(destinations)]
+        self.lane_destinations = np.asarray(destinations)[lanes % len(destinations)]
+        #a missing state is a slice of its own
+        fc, fcs = pd.factorize(shipments[SLICE[0]], sort=True, use_na_sentinel=False)
+        state, states = pd.factorize(shipments[SLICE[1]], sort=True, use_na_sentinel=False)
+        slice_codes, slices = pd.factorize(fc.astype(np.int64) * len(states) + state, sort=True)
+        self.slices = pd.MultiIndex.from_arrays([np.asarray(fcs)[slices // len(states)],
+                                                 np.asarray(states)[slices % len(states)]], names=SLICE)
+        #routes are the (lane, slice) pairs, the shipments of a route are kept as groups of one price paid sorted by
+        #price (a missing price last) with prefix sums of their counts and prices. a route's shipments that switch for
+        #a price are then one contiguous run of groups, the ones that paid above it
+        paid, self.prices = pd.factorize(shipments['shipping_price'].to_numpy(dtype=float), sort=True)
+        paid[paid < 0] = len(self.prices)
+        self.stride = len(self.prices) + 1
+        route, routes = pd.factorize(lane.astype(np.int64) * len(slices) + slice_codes)
+        group, self.groups = pd.factorize(route.astype(np.int64) * self.stride + paid, sort=True)
+        count = np.bincount(group)
+        group_paid = np.append(self.prices, 0.0)[self.groups % self.stride] * count
+        self.cumulative_count = np.concatenate([[0], np.cumsum(count)])
+        self.cumulative_paid = np.concatenate([[0.0], np.cumsum(group_paid)])
+        self.route_lanes, self.route_slices = np.divmod(routes, len(slices))
+        first = np.arange(len(routes), dtype=np.int64) * self.stride
+        self.route_start = np.searchsorted(self.groups, first)
+        self.route_missing = np.searchsorted(self.groups, first + len(self.prices))
+        self.route_end = np.searchsorted(self.groups, first + self.stride)
+        self.incumbent = incumbent
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='simulate') if self.workers > 1 else None
+
+    #per lane: the price and vendor number a shipment would move to, and whether the move is forced by assign
+    def _routes(self, scenario):
+        labels = scenario.rate_cards.labels
+        prices = scenario.rate_cards.lookup(self.lane_origins, self.lane_destinations)
+        for vendor, label in enumerate(labels):
+            if label not in scenario.vendors:
+                prices[:, vendor] = np.nan
+            elif label in scenario.scale:
+                prices[:, vendor] *= scenario.scale[label]
+        filled = np.where(np.isnan(prices), np.inf, prices)
+        vendor = filled.argmin(axis=1)
+        price = filled[np.arange(len(filled)), vendor]
+        forced = np.zeros(len(filled), dtype=bool)
+        for origin, label in scenario.assign.items():
+            lanes = np.flatnonzero(self.lane_origins == origin)
+            assigned = filled[lanes, labels.index(label)]
+            priced = np.isfinite(assigned)
+            vendor[lanes[priced]] = labels.index(label)
+            price[lanes[priced]] = assigned[priced]
+            forced[lanes[priced]] = True
+        return price, vendor, forced
+
+    #shipments, spend and price paid per slice and vendor of one scenario
+    def simulate(self, scenario):
+        labels = scenario.rate_cards.labels
+        price, vendor, forced = self._routes(scenario)
+        price, vendor, forced = price[self.route_lanes], vendor[self.route_lanes], forced[self.route_lanes]
+        #a shipment switches when it paid more than the price and at least min_savings more, every shipment of a
+        #forced route switches (one without a price paid too)
+        if scenario.min_savings > 0:
+            rank = np.searchsorted(self.prices, price + scenario.min_savings, side='left')
+        else:
+            rank = np.searchsorted(self.prices, price, side='right')
+        first = np.searchsorted(self.groups, np.arange(len(price), dtype=np.int64) * self.stride + rank)
+        first = np.where(forced, self.route_start, first)
+        last = np.where(forced, self.route_end, self.route_missing)
+        moved = self.cumulative_count[last] - self.cumulative_count[first]
+        moved_paid = self.cumulative_paid[last] - self.cumulative_paid[first]
+        shipments = self.cumulative_count[self.route_end] - self.cumulative_count[self.route_start]
+        paid = self.cumulative_paid[self.route_end] - self.cumulative_paid[self.route_start]
+
+        #every route adds its switched shipments to its vendor and the others to the incumbent (vendor len(labels))
+        key = np.concatenate([self.route_slices * (len(labels) + 1) + vendor,
+                              self.route_slices * (len(labels) + 1) + len(labels)])
+        size = len(self.slices) * (len(labels) + 1)
+        shipments = np.bincount(key, weights=np.concatenate([moved, shipments - moved]), minlength=size)
+        #moved is 0 on unpriced lanes, whose price is inf: only routes with switched shipments are multiplied
+        moved_spend = np.multiply(price, moved, out=np.zeros_like(price), where=moved > 0)
+        spend = np.bincount(key, weights=np.concatenate([moved_spend, paid - moved_paid]), minlength=size)
+        baseline = np.bincount(key, weights=np.concatenate([moved_paid, paid - moved_paid]), minlength=size)
+        kept = np.flatnonzero(shipments)
+        slices, vendors = np.divmod(kept, len(labels) + 1)
+        result = self.slices[slices].to_frame(index=False)
+        result.insert(0, 'scenario', scenario.name)
+        result['vendor'] = np.array(labels + [self.incumbent], dtype=object)[vendors]
+        result['shipments'] = shipments[kept].astype(np.int64)
+        result['spend'] = spend[kept]
+        result['baseline'] = baseline[kept]
+        result['savings'] = result['baseline'] - result['spend']
+        result['share'] = result['shipments'] / result.groupby(SLICE, observed=True)['shipments'].transform('sum')
+        return result
+
+    #one row per scenario, fc zip, state and vendor: shipments, spend under the scenario, price paid for those
+    #shipments (baseline), savings and the vendor's share of the slice's shipments, in scenario order
+    def run(self, scenarios):
+        if self.executor is None or len(scenarios) < 2:
+            results = [self.simulate(scenario) for scenario in scenarios]
+        else:
+            results = list(self.executor.map(self.simulate, scenarios))
+        if not results:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        return pd.concat(results, ignore_index=True)
+
+
+#totals of run() per scenario and the columns of by (e.g. ['sending_zip_code']), with the vendor shares of those
+#totals
+def summarize(results, by=()):
+    keys = ['scenario'] + list(by)
+    totals = results.groupby(keys + ['vendor'], sort=False, observed=True)[['shipments', 'spend', 'baseline', 'savings']].sum()
+    totals = totals.reset_index()
+    totals['share'] = totals['shipments'] / totals.groupby(keys, sort=False, observed=True)['shipments'].transform('sum')
+    return totals
@@ -0,0 +1,172 @@
+import threading
+
+import pandas as pd
+
+from aggregation import group_rows
+from callback_metrics import phase
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+#----------------------------------------------------------------------------------------------------------------------
+#pluggable query backends
+#the charts ask a backend for the groups of a registered table (a DailyCube or a ShipmentStore) over a date range:
+#the keys, the summed measures and the row count, with equality filters on columns. the pandas backend slices and
+#groups the frames in process and is the reference. the duckdb backend copies every table, sorted by date, into an
+#embedded columnar database (again whenever its version changes), the date range and the filters are pushed down to
+#the scan (row groups outside the range are skipped on their min/max) and the aggregation runs on all its threads.
+#both return the same frame, the keys with the dtypes of the table followed by the measures and the count, in key
+#order. benchmarks/backend_parity.py checks that both give the same chart data
+
+#pandas string bounds are partial: a date without a time covers that whole day, a time without seconds that minute
+_RESOLUTIONS = {10: pd.Timedelta(days=1), 13: pd.Timedelta(hours=1), 16: pd.Timedelta(minutes=1),
+                19: pd.Timedelta(seconds=1)}
+
+
+#(lower, upper, upper inclusive) of frame.loc[start_date:end_date], None for an open end
+def date_bounds(start_date, end_date):
+    lower = pd.Timestamp(start_date) if start_date is not None else None
+    if end_date is None:
+        return lower, None, True
+    step = _RESOLUTIONS.get(len(end_date)) if isinstance(end_date, str) else None
+    if step is None:
+        return lower, pd.Timestamp(end_date), True
+    return lower, pd.Timestamp(end_date) + step, False
+
+
+class QueryBackend:
+
+    name = None
+
+    def __init__(self):
+        self.sources = {}
+
+    def register(self, table, source):
+        self.sources[table] = source
+        return self
+
+    def version(self, table):
+        return getattr(self.sources[table], 'version', 0)
+
+    #same result as counts_by on the rows of the range: the count per group (the weight column summed, or the rows
+    #counted), largest first
+    def counts(self, table, start_date, end_date, keys, weight=None, filters=None, name='shipment_sum'):
+        if weight is None:
+            grouped = self.group(table, start_date, end_date, keys, filters=filters, rows=name)
+        else:
+            grouped = self.group(table, start_date, end_date, keys, [weight], filters).rename(columns={weight: name})
+        counts = grouped.set_index(list(keys))[name]
+        return counts.sort_values(ascending=False).reset_index(name=name)
+
+    def group(self, table, start_date, end_date, keys, measures=(), filters=None, rows=None, dropna=True):
+        raise NotImplementedError
+
+
+class PandasBackend(QueryBackend):
+
+    name = 'pandas'
+
+    #aggregator (a ShardedAggregator) groups large slices in date shards
+    def __init__(self, aggregator=None):
+        super().__init__()
+        self.aggregator = aggregator
+
+    def group(self, table, start_date, end_date, keys, measures=(), filters=None, rows=None, dropna=True):
+        frame = self.sources[table].slice(start_date, end_date)
+        for column, value in (filters or {}).items():
+            frame = frame[frame[column] == value]
+        return group_rows(frame, keys, measures, rows, dropna, self.aggregator)
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _parameter(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+class DuckDBBackend(QueryBackend):
+
+    name = 'duckdb'
+
+    #threads None uses every core
+    def __init__(self, threads=None):
+        if duckdb is None:
+            raise ImportError('QUERY_BACKEND=duckdb needs the optional duckdb package (pip install duckdb), '
+                              'see requirements-optional.txt')
+        super().__init__()
+        self.connection = duckdb.connect(':memory:')
+        if threads:
+            self.connection.execute('SET threads = %d' % threads)
+        #table -> (version, date column, dtypes) of the copy in the database
+        self.loaded = {}
+        self._lock = threading.Lock()
+
+    def _load(self, table):
+        source = self.sources[table]
+        version = self.version(table)
+        with self._lock:
+            if table not in self.loaded or self.loaded[table][0] != version:
+                #a cube keeps its rows in .table, a shipment store in .frame
+                frame = source.table if hasattr(source, 'table') else source.frame
+                rows = frame.reset_index()
+                self.connection.register('incoming', rows)
+                self.connection.execute('CREATE OR REPLACE TABLE %s AS SELECT * FROM incoming ORDER BY %s'
+                                        % (_quote(table), _quote(rows.columns[0])))
+                self.connection.unregister('incoming')
+                self.loaded[table] = (version, rows.columns[0], rows.dtypes)
+            return self.loaded[table]
+
+    def group(self, table, start_date, end_date, keys, measures=(), filters=None, rows=None, dropna=True):
+        _, date_column, dtypes = self._load(table)
+        conditions, parameters = [], []
+        lower, upper, inclusive = date_bounds(start_date, end_date)
+        if lower is not None:
+            conditions.append('%s >= ?' % _quote(date_column))
+            parameters.append(lower.to_pydatetime())
+        if upper is not None:
+            conditions.append('%s %s ?' % (_quote(date_column), '<=' if inclusive else '<'))
+            parameters.append(upper.to_pydatetime())
+        for column, value in (filters or {}).items():
+            #categoricals are compared as text, a value outside the categories matches nothing
+            text = dtypes[column] == 'category'
+            conditions.append(('CAST(%s AS VARCHAR) = ?' if text else '%s = ?') % _quote(column))
+            parameters.append(str(value) if text else _parameter(value))
+        if dropna:
+            conditions += ['%s IS NOT NULL' % _quote(key) for key in keys]
+
+        columns = [_quote(key) for key in keys]
+        for measure in measures:
+            if dtypes[measure].kind in 'iub':
+                columns.append('CAST(SUM(%s) AS BIGINT) AS %s' % (_quote(measure), _quote(measure)))
+            else:
+                #compensated sum like the pandas groupby, which also gives 0 for a group of missing values
+                columns.append('COALESCE(fsum(%s), 0) AS %s' % (_quote(measure), _quote(measure)))
+        if rows is not None:
+            columns.append('CAST(COUNT(*) AS BIGINT) AS %s' % _quote(rows))
+        group = ', '.join(_quote(key) for key in keys)
+        #pandas groups categoricals on their codes, a missing one (code -1) comes first
+        order = ', '.join('%s NULLS %s' % (_quote(key), 'FIRST' if dtypes[key] == 'category' else 'LAST')
+                          for key in keys)
+        query = 'SELECT %s FROM %s%s GROUP BY %s ORDER BY %s' % (
+            ', '.join(columns), _quote(table), ' WHERE ' + ' AND '.join(conditions) if conditions else '', group, order)
+
+        with phase('query') as timed:
+            cursor = self.connection.cursor()
+            try:
+                result = cursor.execute(query, parameters).df()
+            finally:
+                cursor.close()
+            timed.rows = len(result)
+        return result.astype({key: dtypes[key] for key in keys})
+
+
+def make_backend(name, aggregator=None, threads=None):
+    if name == 'pandas':
+        return PandasBackend(aggregator)
+    if name == 'duckdb':
+        return DuckDBBackend(threads)
+    raise ValueError('unknown query backend %r, expected pandas or duckdb' % name)
@@ -0,0 +1,112 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+#----------------------------------------------------------------------------------------------------------------------
+#rate card engine
+#every vendor table is loaded into one dense (origin zip x destination zip x vendor) price array, missing lanes are
+#nan. pricing a batch of shipments is one index lookup for all vendors, the lowest price and the vendor offering it
+#come from a min/argmin over the vendor axis, so another carrier is one more slice of the array.
+#with a distance fallback a lane a vendor does not price gets the vendor's median price for lanes from the same origin
+#in the same distance range, the distances come from the zip centroids (distances.DistanceEngine)
+
+
+def vendor_label(vendor):
+    #'vendor_A' in the rate card files is shown as 'Vendor A' in the dashboard
+    return vendor.replace('vendor_', 'Vendor ')
+
+
+def load_rate_card(path):
+    card = pd.read_csv(path, low_memory=False)
+    price_column = [column for column in card.columns if column.endswith('_pricing')][0]
+    card = card[['vendor', 'sending_zip', 'receiving_zip', price_column]].rename(columns={price_column: 'price'})
+    return card
+
+
+class RateCardIndex:
+
+    #cards maps the price column name (e.g. 'vendor_A_pricing') to a frame with sending_zip, receiving_zip and price
+    def __init__(self, cards, labels=None):
+        self.columns = list(cards)
+        self.labels = list(labels) if labels is not None else [vendor_label(column[:-len('_pricing')])
+                                                               for column in self.columns]
+        frames = list(cards.values())
+        self.origins = pd.Index(np.unique(np.concatenate([card['sending_zip'].to_numpy() for card in frames])))
+        self.destinations = pd.Index(np.unique(np.concatenate([card['receiving_zip'].to_numpy() for card in frames])))
+        self.prices = np.full((len(self.origins), len(self.destinations), len(frames)), np.nan)
+        for vendor, card in enumerate(frames):
+            #a lane listed twice keeps the last price
+            origin = self.origins.get_indexer(card['sending_zip'])
+            destination = self.destinations.get_indexer(card['receiving_zip'])
+            self.prices[origin, destination, vendor] = card['price'].to_numpy(dtype=float)
+        self.distances = None
+        self.scheme = None
+        self.band_prices = None
+
+    @classmethod
+    def from_files(cls, paths):
+        cards = {}
+        for path in paths:
+            card = load_rate_card(path)
+            cards[card['vendor'].iloc[0] + '_pricing'] = card
+        return cls(cards)
+
+    #distances is a DistanceEngine, scheme the BucketScheme cutting miles into ranges. the (origin x range x vendor)
+    #median prices are computed once from every priced lane
+    def distance_fallback(self, distances, scheme):
+        lanes = pd.MultiIndex.from_product([self.origins, self.destinations])
+        miles = distances.distances(lanes.get_level_values(0), lanes.get_level_values(1))
+        band = scheme.codes(miles).reshape(len(self.origins), len(self.destinations))
+        band[np.isnan(miles).reshape(band.shape)] = -1
+        self.band_prices = np.full((len(self.origins), len(scheme.labels) + 1, len(self.columns)), np.nan)
+        with warnings.catch_warnings():
+            #ranges without a priced lane stay nan
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for code in range(len(scheme.labels) + 1):
+                in_band = np.where((band == code)[:, :, None], self.prices, np.nan)
+                self.band_prices[:, code] = np.nanmedian(in_band, axis=1)
+        self.distances = distances
+        self.scheme = scheme
+        return self
+
+    #(shipments x vendors) prices, nan where a vendor has no price for the lane (and no fallback price)
+    def lookup(self, origin_zips, destination_zips):
+        origin = self.origins.get_indexer(origin_zips)
+        destination = self.destinations.get_indexer(destination_zips)
+        found = (origin >= 0) & (destination >= 0)
+        prices = np.full((len(origin), len(self.columns)), np.nan)
+        prices[found] = self.prices[origin[found], destination[found]]
+        if self.band_prices is not None:
+            self._fill_from_distance(prices, origin, np.asarray(origin_zips), np.asarray(destination_zips))
+        return prices
+
+    def _fill_from_distance(self, prices, origin, origin_zips, destination_zips):
+        unpriced = np.isnan(prices).any(axis=1) & (origin >= 0)
+        if not unpriced.any():
+            return
+        miles = self.distances.distances(origin_zips[unpriced], destination_zips[unpriced])
+        rows = np.flatnonzero(unpriced)[~np.isnan(miles)]
+        band = self.scheme.codes(miles[~np.isnan(miles)])
+        prices[rows] = np.where(np.isnan(prices[rows]), self.band_prices[origin[rows], band], prices[rows])
+
+    #lowest available price and the vendor that should have shipped, for every shipment in one pass.
+    #a vendor is picked when it is the only cheapest one and beats the price paid, incumbent when the price paid is
+    #at most every vendor's price, '0' otherwise (a tie between vendors or a lane a vendor does not price)
+    def best(self, prices, shipping_price, incumbent='Vendor C'):
+        shipping_price = np.asarray(shipping_price, dtype=float)
+        missing = np.isnan(prices)
+        filled = np.where(missing, np.inf, prices)
+        lowest = filled.min(axis=1)
+        cheapest = filled.argmin(axis=1)
+        all_priced = ~missing.any(axis=1)
+        only_cheapest = (filled == lowest[:, None]).sum(axis=1) == 1
+        lowest[np.isinf(lowest)] = np.nan
+
+        choice = np.full(len(lowest), len(self.labels) + 1)
+        switch = all_priced & only_cheapest & (lowest < shipping_price)
+        keep = all_priced & (shipping_price <= lowest)
+        choice[switch] = cheapest[switch]
+        choice[keep] = len(self.labels)
+        optimal_vendor = np.array(self.labels + [incumbent, '0'], dtype=object)[choice]
+        return lowest, optimal_vendor
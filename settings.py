@@ -0,0 +1,81 @@
+import os
+
+#----------------------------------------------------------------------------------------------------------------------
+#performance settings shared by both dashboards, every value can be overridden with an environment variable of the
+#same name
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    return default if value is None or value == '' else cast(value)
+
+
+def _flag(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+#on-disk cache of the prepared frames
+DATA_CACHE_DIR = _env('DATA_CACHE_DIR', '.data_cache')
+#multi-worker deployments: a directory in shared memory (e.g. /dev/shm/dashboards) the prepared frames are published
+#to once and memory mapped by every worker, used instead of DATA_CACHE_DIR when set
+SHARED_DATASET_DIR = _env('SHARED_DATASET_DIR', '')
+#the cached frames are rebuilt when the size or mtime of a source file changes. DATA_CACHE_CHECK_CONTENT also hashes
+#every source file at every start, to catch edits that keep both (reads the whole file, slow for large sources)
+DATA_CACHE_CHECK_CONTENT = _env('DATA_CACHE_CHECK_CONTENT', False, _flag)
+
+#server side figure cache around the build_graph callbacks
+FIGURE_CACHE_MAX_ENTRIES = _env('FIGURE_CACHE_MAX_ENTRIES', 256, int)
+FIGURE_CACHE_MAX_MB = _env('FIGURE_CACHE_MAX_MB', 128, float)
+
+#incremental ingestion: directories polled for new csv batches of shipments (empty disables the watcher)
+SHIPMENT_INGEST_DIR = _env('SHIPMENT_INGEST_DIR', '')
+PRICING_INGEST_DIR = _env('PRICING_INGEST_DIR', '')
+INGEST_INTERVAL_SECONDS = _env('INGEST_INTERVAL_SECONDS', 60, float)
+
+#callback instrumentation: json lines log of requests slower than CALLBACK_SLOW_MS (empty disables the log)
+CALLBACK_TRACE_LOG = _env('CALLBACK_TRACE_LOG', '')
+CALLBACK_SLOW_MS = _env('CALLBACK_SLOW_MS', 1000, float)
+
+#scatter charts send at most this many markers, larger slices are binned (log distance x days) and sized by count
+SCATTER_POINT_BUDGET = _env('SCATTER_POINT_BUDGET', 5000, int)
+
+#outbound dashboard: send the pre-aggregated tables of a date range to the browser once and filter them there on
+#group, product, fc and shipping method dropdown changes instead of calling the server
+CLIENTSIDE_FILTERING = _env('CLIENTSIDE_FILTERING', False, _flag)
+
+#figures: numeric trace arrays sent as binary typed arrays instead of decimal text
+BINARY_FIGURES = _env('BINARY_FIGURES', False, _flag)
+#gzip (brotli when installed) compression of the dash json responses larger than COMPRESS_MIN_BYTES
+COMPRESS_RESPONSES = _env('COMPRESS_RESPONSES', True, _flag)
+COMPRESS_MIN_BYTES = _env('COMPRESS_MIN_BYTES', 1024, int)
+
+#heavy callbacks run on this many worker threads, a newer request for the same output from the same browser cancels
+#the stale job (0 runs them in the request threads)
+CALLBACK_WORKERS = _env('CALLBACK_WORKERS', 4, int)
+
+#figure cache warm-up at startup and after every data refresh: the layout defaults plus the WARM_TOP_VIEWS most
+#requested views, the dataset version is checked every WARM_CHECK_SECONDS
+CACHE_WARMER = _env('CACHE_WARMER', True, _flag)
+WARM_TOP_VIEWS = _env('WARM_TOP_VIEWS', 20, int)
+WARM_CHECK_SECONDS = _env('WARM_CHECK_SECONDS', 30, float)
+
+#wide date ranges are grouped in date shards of at least SHARD_MIN_ROWS rows on this many threads and the partial
+#counts and sums merged (0 or 1 groups in the request thread), empty uses every core
+AGGREGATION_WORKERS = _env('AGGREGATION_WORKERS', None, int)
+SHARD_MIN_ROWS = _env('SHARD_MIN_ROWS', 250000, int)
+
+#outbound dashboard out-of-core mode: the shipment csv is streamed in chunks of CHUNK_ROWS rows into the daily cubes
+#and a date partitioned copy in PARTITION_DIR (read back for raw rows), the full history is never held in memory
+OUT_OF_CORE = _env('OUT_OF_CORE', False, _flag)
+CHUNK_ROWS = _env('CHUNK_ROWS', 500000, int)
+PARTITION_DIR = _env('PARTITION_DIR', os.path.join(DATA_CACHE_DIR, 'shipment_partitions'))
+
+#zip centroid table (csv with zip, latitude and longitude columns): shipments exported without a distance get it from
+#their zips, and with RATE_FALLBACK the pricing dashboard prices the lanes missing from a vendor's rate card at the
+#vendor's median price for the origin and distance range
+ZIP_CENTROIDS = _env('ZIP_CENTROIDS', '')
+RATE_FALLBACK = _env('RATE_FALLBACK', False, _flag)
+
+#engine the charts run their groupings on: pandas (the reference) or duckdb (embedded columnar sql, multi-threaded,
+#needs the optional duckdb package, see requirements-optional.txt)
+QUERY_BACKEND = _env('QUERY_BACKEND', 'pandas')
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from background import checkpoint
+
+#----------------------------------------------------------------------------------------------------------------------
+#date sharded aggregation
+#a date sorted frame is cut into contiguous shards, one per worker, at day boundaries. every shard is grouped on its
+#own in a thread pool and the partial counts and sums are added up per group, in the same sorted group order as one
+#groupby over the whole frame. pandas releases the GIL while it hashes integer keys (days, categorical codes) and sums,
+#so a wide date range uses several cores. frames with less than two shards of min_rows are grouped in the calling
+#thread as before. counts and integer sums are identical to the serial groupby, float sums are too when every group
+#sits in one shard (grouped by day), otherwise they can differ in the last bits (they are added in another order)
+
+
+class ShardedAggregator:
+
+    #0 or 1 workers groups every frame in the calling thread
+    def __init__(self, workers=None, min_rows=250000):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.min_rows = max(min_rows, 1)
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='aggregate') if self.workers > 1 else None
+        self.sharded = 0
+        self.serial = 0
+
+    def stats(self):
+        return {'workers': self.workers, 'sharded': self.sharded, 'serial': self.serial}
+
+    #row positions the shards start at (plus the end), and whether they were cut at day boundaries
+    def bounds(self, frame):
+        count = min(self.workers, len(frame) // self.min_rows) if self.executor is not None else 1
+        if count <= 1:
+            return [0, len(frame)], True
+        cuts = [len(frame) * shard // count for shard in range(1, count)]
+        by_day = isinstance(frame.index, pd.DatetimeIndex) and frame.index.is_monotonic_increasing
+        if by_day:
+            #back to the first row of the day, a day is never split over two shards
+            cuts = [frame.index.searchsorted(frame.index[cut].normalize(), side='left') for cut in cuts]
+        return sorted(set([0] + cuts + [len(frame)])), by_day
+
+    #partial(shard) groups a shard (a series or frame indexed by the group keys, sorted), the partials are summed per
+    #group. disjoint_days says the keys start with the day, so shards cut at day boundaries share no group and their
+    #partials are only concatenated
+    def aggregate(self, frame, partial, disjoint_days=False):
+        bounds, by_day = self.bounds(frame)
+        if len(bounds) <= 2:
+            self.serial += 1
+            return partial(frame)
+        futures = [self.executor.submit(partial, frame.iloc[start:stop]) for start, stop in zip(bounds, bounds[1:])]
+        partials = []
+        try:
+            for future in futures:
+                partials.append(future.result())
+                #a superseded callback stops here instead of waiting for the other shards
+                checkpoint()
+        finally:
+            for future in futures:
+                future.cancel()
+        self.sharded += 1
+        merged = pd.concat(partials)
+        if disjoint_days and by_day:
+            return merged
+        levels = list(range(merged.index.nlevels)) if merged.index.nlevels > 1 else 0
+        return merged.groupby(level=levels, dropna=False).sum()
+
+    #same result as frame.groupby(keys).size()
+    def size(self, frame, keys):
+        return self.aggregate(frame, lambda shard: shard.groupby(keys).size())
+
+    #same result as frame.groupby(keys).sum(), over the numeric columns or the given ones
+    def sum(self, frame, keys, columns=None):
+        if columns is None:
+            return self.aggregate(frame, lambda shard: shard.groupby(keys).sum())
+        return self.aggregate(frame, lambda shard: shard.groupby(keys)[list(columns)].sum())
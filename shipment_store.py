@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from callback_metrics import phase
+
+#----------------------------------------------------------------------------------------------------------------------
+#time indexed shipment store
+#the frame is sorted once, date range slices are a binary search on the index and come back as views, not copies.
+#the last few slices are kept so callbacks that fire for the same date range share one slice.
+#appended batches are kept as extra sorted segments so an append costs the size of the batch, a slice that spans
+#several segments is the concatenation of their slices. every append bumps the version
+
+
+def match_categories(frames, batch):
+    #give the batch the categories of the stored frames' categorical columns (a batch of plain strings is categorized
+    #first) so they concatenate as categoricals. only when the batch brings new values are the stored frames recoded
+    #to the (sorted) union
+    frames = list(frames)
+    for column in batch.columns:
+        if not frames or frames[0][column].dtype != 'category':
+            continue
+        if batch[column].dtype != 'category':
+            batch = batch.assign(**{column: batch[column].astype('category')})
+        categories = frames[0][column].cat.categories
+        new_values = batch[column].cat.categories.difference(categories)
+        if len(new_values):
+            categories = categories.union(new_values)
+            for position, frame in enumerate(frames):
+                frames[position] = frame.assign(**{column: frame[column].cat.set_categories(categories)})
+        batch = batch.assign(**{column: batch[column].cat.set_categories(categories)})
+    return frames, batch
+
+
+class ShipmentStore:
+
+    def __init__(self, frame, max_slices=8, max_segments=16):
+        #a frame that is already sorted (e.g. attached from shared memory) is used as is, not copied
+        frame = frame if frame.index.is_monotonic_increasing else frame.sort_index(kind='mergesort')
+        self.segments = [frame]
+        self.staged = []
+        self.max_slices = max_slices
+        self.max_segments = max_segments
+        self.version = 0
+        self._slices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def frame(self):
+        if len(self.segments) > 1:
+            with self._lock:
+                self.segments = [self._compact(self.segments)]
+        return self.segments[0]
+
+    @staticmethod
+    def _compact(segments):
+        return pd.concat(segments).sort_index(kind='mergesort')
+
+    #batches are staged and swapped in by commit(), like the cubes (see ingest.apply_batch)
+    def stage(self, batch):
+        self.staged.append(batch if batch.index.is_monotonic_increasing else batch.sort_index(kind='mergesort'))
+
+    #the segments with the staged batches added, the store itself is not changed
+    def merged(self):
+        segments = list(self.segments)
+        for batch in self.staged:
+            segments, batch = match_categories(segments, batch)
+            segments.append(batch)
+        if len(segments) > self.max_segments:
+            segments = [self._compact(segments)]
+        return segments
+
+    def commit(self, segments=None):
+        segments = self.merged() if segments is None else segments
+        with self._lock:
+            self.segments = segments
+            self.staged = []
+            self.version += 1
+            self._slices.clear()
+
+    def discard(self):
+        self.staged = []
+
+    def append(self, batch):
+        self.stage(batch)
+        self.commit()
+
+    @staticmethod
+    def positions(segment, start_date, end_date):
+        #same bounds as .loc[start_date:end_date], a partial date like '2022-11-17' covers that whole day
+        return segment.index.slice_indexer(start_date, end_date)
+
+    def slice(self, start_date, end_date):
+        with self._lock:
+            key = (self.version, start_date, end_date)
+            segments = self.segments
+            if key in self._slices:
+                self._slices.move_to_end(key)
+                return self._slices[key]
+        with phase('slice') as timed:
+            pieces = [segment.iloc[self.positions(segment, start_date, end_date)] for segment in segments]
+            non_empty = [piece for piece in pieces if len(piece)]
+            frame_slice = pd.concat(non_empty) if len(non_empty) > 1 else (non_empty or pieces)[0]
+            timed.rows = len(frame_slice)
+        with self._lock:
+            self._slices[key] = frame_slice
+            while len(self._slices) > self.max_slices:
+                self._slices.popitem(last=False)
+        return frame_slice
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregation import counts_by, decode_codes, grouping_keys, sums_by
+from callback_metrics import phase
+from shipment_store import match_categories
+
+#----------------------------------------------------------------------------------------------------------------------
+#daily aggregate cube
+#one row per day and combination of dimension values with the number of shipments (and optional summed measures),
+#so a date range query sums a few hundred cube rows instead of scanning every shipment.
+#a new batch of shipments is aggregated on its own and only the days it touches are re-aggregated in the cube
+
+COUNT = 'shipment_count'
+
+
+def _day_table(frame, dims, measures):
+    day = frame.index.normalize().rename(frame.index.name)
+    grouped = frame.groupby([day] + grouping_keys(frame, dims), dropna=False)
+    counts = grouped.size()
+    table = grouped[list(measures)].sum() if measures else pd.DataFrame(index=counts.index)
+    table[COUNT] = counts
+    return table
+
+
+#aggregator (a ShardedAggregator) groups a large frame in date shards on several threads
+def build_daily_cube(frame, dims, measures=(), aggregator=None):
+    if aggregator is None:
+        table = _day_table(frame, dims, measures)
+    else:
+        table = aggregator.aggregate(frame, lambda shard: _day_table(shard, dims, measures), disjoint_days=True)
+    return decode_codes(table.reset_index(level=list(dims)), frame, dims)
+
+
+#cubes of chunks of the history (build_daily_cube of each) as one cube: the chunks are recoded to the union of their
+#categories, concatenated and grouped once, a day that several chunks touch is summed. n chunks cost one grouping of
+#their aggregates instead of n merges into the growing cube
+def combine_daily_cubes(tables, dims, measures=()):
+    tables = list(tables)
+    if len(tables) == 1:
+        return tables[0]
+    for column in dims:
+        if tables[0][column].dtype == 'category':
+            categories = tables[0][column].cat.categories
+            for table in tables[1:]:
+                categories = categories.union(table[column].cat.categories)
+            tables = [table.assign(**{column: table[column].cat.set_categories(categories)}) for table in tables]
+    both = pd.concat(tables)
+    grouped = both.groupby([both.index] + grouping_keys(both, dims), dropna=False)
+    return decode_codes(grouped[list(measures) + [COUNT]].sum().reset_index(level=list(dims)), both, dims)
+
+
+#the days of the batch are re-aggregated and spliced into the day sorted cube at their positions, the rest of the cube
+#is not regrouped or sorted again
+def merge_daily_cubes(table, batch_table, dims, measures=()):
+    (table,), batch_table = match_categories([table], batch_table)
+    touched = table.index.isin(batch_table.index.unique())
+    rest = table[~touched]
+    merged = combine_daily_cubes([table[touched], batch_table], dims, measures)
+    #the touched days are not in rest, every row's place is its own position plus the rows of the other part before
+    #its day
+    order = np.empty(len(rest) + len(merged), dtype=np.int64)
+    order[np.arange(len(rest)) + merged.index.searchsorted(rest.index)] = np.arange(len(rest))
+    order[np.arange(len(merged)) + rest.index.searchsorted(merged.index)] = len(rest) + np.arange(len(merged))
+    return pd.concat([rest, merged]).iloc[order]
+
+
+class DailyCube:
+
+    #frame None starts an empty cube, filled by appending chunks of the history
+    def __init__(self, frame, dims, measures=(), aggregator=None):
+        self.dims = list(dims)
+        self.measures = list(measures)
+        self.aggregator = aggregator
+        self.version = 0
+        self.table = None if frame is None else build_daily_cube(frame, self.dims, self.measures, aggregator)
+        self.staged = []
+        self._lock = threading.Lock()
+
+    #chunks of the history (or a batch) are aggregated on their own as they come and merged into the cube at once by
+    #commit(), loading the history is one merge instead of one per chunk
+    def stage(self, chunk):
+        self.staged.append(build_daily_cube(chunk, self.dims, self.measures, self.aggregator))
+
+    #the cube with the staged chunks merged in, the cube itself is not changed
+    def merged(self):
+        staged = combine_daily_cubes(self.staged, self.dims, self.measures)
+        return staged if self.table is None else merge_daily_cubes(self.table, staged, self.dims, self.measures)
+
+    #swaps in table (by default merged()) and drops the staged chunks
+    def commit(self, table=None):
+        table = self.merged() if table is None else table
+        with self._lock:
+            self.table = table
+            self.staged = []
+            self.version += 1
+
+    def discard(self):
+        self.staged = []
+
+    def append(self, batch):
+        self.stage(batch)
+        self.commit()
+
+    def slice(self, start_date, end_date):
+        with phase('slice') as timed:
+            cube_slice = self.table.loc[start_date:end_date]
+            timed.rows = len(cube_slice)
+        return cube_slice
+
+    #same result as frame.loc[start:end].groupby(keys).size().sort_values(ascending=False).reset_index(name=name)
+    def counts(self, start_date, end_date, keys, name='shipment_sum'):
+        return counts_by(self.slice(start_date, end_date), keys, COUNT, name)
+
+    def sums(self, start_date, end_date, keys, measures=None):
+        return sums_by(self.slice(start_date, end_date), keys, list(measures or self.measures) + [COUNT])
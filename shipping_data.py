@@ -0,0 +1,89 @@
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from bucketing import BucketScheme, add_buckets
+
+#----------------------------------------------------------------------------------------------------------------------
+#data cleaning for the outbound shipping dashboard
+
+
+#low cardinality string columns kept as categoricals, the callbacks group on their codes
+CATEGORY_COLUMNS = ['shipment_service', 'group', 'transportmode', 'fc', 'product_name', 'recipient_state',
+                    'Date_difference_barchart_v1']
+
+
+#bucketed columns: name -> (source column, scheme). whole days in transit (0 and 1 both count as '1') and shipping
+#distance in miles, each bin runs from the previous edge (exclusive) to its own edge (inclusive)
+BUCKETS = {
+    'Date_difference_barchart_v1': ('time_delta', BucketScheme([0, 1, 2, 3, 4, 5, 500],
+                                                               ['1', '2', '3', '4', '5', '6+'], default='0')),
+    'Shipping ranges': ('haversine_distance_miles', BucketScheme([1, 25, 50, 75, 100, 150, 200, 250, 5000],
+                                                                 [25, 50, 75, 100, 150, 200, 250, 500], default=0)),
+}
+
+
+#zips of the export the distance engine works from, the same columns the pricing export has
+ORIGIN_ZIP = 'sending_zip_code'
+DESTINATION_ZIP = 'delivery_zipcode'
+
+
+def downcast(values):
+    return pd.to_numeric(values, downcast='integer')
+
+
+#haversine_distance_miles from the zip centroids (a DistanceEngine) where the export left it out or empty and the rows
+#carry their origin and destination zips
+def fill_distances(df, distances):
+    if distances is None or ORIGIN_ZIP not in df or DESTINATION_ZIP not in df:
+        return
+    if 'haversine_distance_miles' not in df:
+        df['haversine_distance_miles'] = np.nan
+    missing = df['haversine_distance_miles'].isna().to_numpy()
+    if missing.any():
+        df.loc[missing, 'haversine_distance_miles'] = distances.distances(df[ORIGIN_ZIP].to_numpy()[missing],
+                                                                          df[DESTINATION_ZIP].to_numpy()[missing])
+
+
+#builds df5 in place on the frame read from the csv, no intermediate copies are kept
+def prepare_shipments(df, distances=None):
+    df['delivery_date'] = pd.to_datetime(df['delivery_date'])
+    df['purchase_time'] = pd.to_datetime(df['purchase_time'])
+    df['shipment_service'] = df['shipment_service'].fillna('Same_day')
+    df.drop(df.index[df['shipment_service'] == '0'], inplace=True)
+
+    #shipping distance and time between order placed and order shipped
+
+    time_delta = np.ceil((df.delivery_date - df.purchase_time) / np.timedelta64(1, 'D')).astype('int')
+    df['time_delta'] = downcast(time_delta)
+    fill_distances(df, distances)
+    add_buckets(df, BUCKETS)
+    df['Shipping ranges'] = downcast(df['Shipping ranges'])
+    distance = df['haversine_distance_miles']
+    #a distance still missing (a zip without a centroid) is in the default range (0) and counted as 0 miles
+    unresolved = int(distance.isna().sum())
+    if unresolved:
+        warnings.warn('%d shipments have no shipping distance, counted as 0 miles' % unresolved)
+    df['Shipping_distance'] = downcast(distance.fillna(0).astype('int'))
+    df['haversine_distance_miles'] = distance.astype('float32')
+
+    #---------------------------------------------------------------------------------------
+
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    df.set_index('delivery_date', inplace=True)
+    #sorted so the shipment store can use it without another sorted copy
+    df.sort_index(kind='mergesort', inplace=True)
+    return df
+
+
+def load_shipments(path="dummy_data.csv", distances=None):
+    return prepare_shipments(pd.read_csv(path, low_memory=False), distances)
+
+
+#the csv in chunks of chunk_rows, prepared one by one. shipment_service is read as text, a chunk whose services are
+#all '0' or missing would be parsed as numbers otherwise
+def load_shipment_chunks(path="dummy_data.csv", chunk_rows=500000, distances=None):
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype={'shipment_service': str}):
+        yield prepare_shipments(chunk, distances)
@@ -0,0 +1,63 @@
+import threading
+
+#----------------------------------------------------------------------------------------------------------------------
+#single flight
+#concurrent calls for the same key run the function once: the first call (the leader) computes, the ones arriving
+#while it runs wait for its result or its error instead of computing it again. a leader that stops for reasons of its
+#own raises Cancelled (e.g. background.Superseded, its browser asked for something newer), the waiting calls then run
+#the function themselves. the function should look its result up first and store it before returning, so a call
+#arriving right after a leader finished finds it instead of computing it again
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    #calls in progress
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, func):
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Flight()
+                else:
+                    self.coalesced += 1
+            if leader:
+                return self._lead(key, flight, func)
+            flight.done.wait()
+            if isinstance(flight.error, Cancelled):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+    def _lead(self, key, flight, func):
+        try:
+            flight.value = func()
+            return flight.value
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
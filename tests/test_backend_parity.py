@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmarks import backend_parity
+from benchmarks.synthetic_data import write_dataset
+
+#----------------------------------------------------------------------------------------------------------------------
+#query backend parity
+#every server callback of both apps over the benchmark sweeps, once with the pandas backend and once with duckdb on
+#the same seeded data: no callback may fail on either backend and the chart data has to match
+
+ROWS = 20_000
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('backend_parity'))
+    write_dataset(directory, ROWS, seed=0)
+    return directory
+
+
+@pytest.mark.parametrize('app', sorted(backend_parity.APPS))
+def test_backends_return_the_same_charts(app, data_dir):
+    pytest.importorskip('duckdb')
+    assert backend_parity.check([app], data_dir) == 0
@@ -0,0 +1,129 @@
+import datetime
+import json
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+import flask
+
+#----------------------------------------------------------------------------------------------------------------------
+#figure cache warmer
+#after startup, and again every time the dataset version changes, a background thread calls every server callback
+#with the default values of its inputs in the layout (the preset date range, 'Group B', 'Product B', ...) and with the
+#input tuples requested most often recently, so the figure cache already holds them when users arrive.
+#/health answers 503 until the first warm-up is done, then 200 with the state of the warmer
+
+
+def _components(layout, found):
+    component_id = getattr(layout, 'id', None)
+    if component_id is not None:
+        found[component_id] = layout
+    children = getattr(layout, 'children', None)
+    for child in children if isinstance(children, (list, tuple)) else [children]:
+        if hasattr(child, 'to_plotly_json'):
+            _components(child, found)
+    return found
+
+
+def _browser_value(value):
+    #dates in the layout reach the callbacks as the iso strings the browser sends
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+class CacheWarmer(threading.Thread):
+
+    #version returns the current dataset version, top is how many of the recently requested views are warmed
+    def __init__(self, app, version, top=20, interval=30, history=2000):
+        super().__init__(daemon=True, name='cache-warmer')
+        self.app = app
+        self.version = version
+        self.top = top
+        self.interval = interval
+        self.requests = deque(maxlen=history)
+        self.warmed_version = None
+        self.warming = False
+        self.runs = 0
+        self.views = 0
+        self.errors = 0
+        self.seconds = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def default_views(self):
+        components = _components(self.app.layout, {})
+        views = []
+        for output, callback in self.app.callback_map.items():
+            if 'callback' not in callback:
+                continue
+            try:
+                args = [_browser_value(getattr(components[item['id']], item['property']))
+                        for item in callback['inputs'] + callback['state']]
+            except (KeyError, AttributeError):
+                continue
+            views.append((output, args))
+        return views
+
+    def popular_views(self):
+        with self._lock:
+            counts = Counter(self.requests)
+        return [(output, json.loads(args)) for (output, args), _ in counts.most_common(self.top)]
+
+    def warm_up(self, version):
+        self.warming = True
+        start = time.perf_counter()
+        warmed = set()
+        for output, args in self.default_views() + self.popular_views():
+            key = (output, json.dumps(args))
+            if key in warmed or output not in self.app.callback_map:
+                continue
+            warmed.add(key)
+            try:
+                #the callback below the dash wrapper: the figure cache, then the callback itself
+                self.app.callback_map[output]['callback'].__wrapped__(*args)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+        self.views = len(warmed)
+        self.seconds = time.perf_counter() - start
+        self.runs += 1
+        self.warmed_version = version
+        self.warming = False
+
+    def run(self):
+        while True:
+            version = self.version()
+            if version != self.warmed_version:
+                self.warm_up(version)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    #call after new data was added, the warmer re-warms for the new version without waiting for its next check
+    def refresh(self):
+        self._wake.set()
+
+    def health(self):
+        if not self.is_alive():
+            return {'status': 'ok', 'warmer': 'off'}, 200
+        state = {'status': 'ok' if self.runs else 'warming', 'warming': self.warming, 'version': self.version(),
+                 'warmed_version': self.warmed_version, 'views': self.views, 'errors': self.errors,
+                 'runs': self.runs, 'last_warm_seconds': self.seconds}
+        return state, 200 if self.runs else 503
+
+    def _before_request(self):
+        if flask.request.path.endswith('/_dash-update-component'):
+            body = flask.request.get_json(silent=True) or {}
+            args = [item.get('value') for item in body.get('inputs', []) + body.get('state', [])]
+            with self._lock:
+                self.requests.append((body.get('output'), json.dumps(args)))
+
+    #records the requested views and adds the /health route
+    def register(self, app):
+        app.server.before_request(self._before_request)
+        app.server.add_url_rule('/health', 'health', self._health_response)
+
+    def _health_response(self):
+        state, status = self.health()
+        return flask.jsonify(state), status